@@ -0,0 +1,348 @@
+# reduced ordered binary decision diagrams
+# a node is an int indexing the arrays var/low/high of its manager, 0 and 1 are the terminals
+# variables are ints, ordered by their value
+# Function wraps a node and keeps it alive: garbage collection only frees nodes
+# that no Function refers to (directly or below), and only runs between operations
+
+import sys
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+FALSE = 0
+TRUE = 1
+TERMINAL = sys.maxsize # the variable of the terminals, below all others
+
+
+class BDD:
+
+    def __init__(self, gc_threshold: int = 1 << 18, cache_limit: int = 1 << 20) -> None:
+        self.num_vars = 0
+        self.var: List[int] = [TERMINAL, TERMINAL]
+        self.low: List[int] = [FALSE, TRUE]
+        self.high: List[int] = [FALSE, TRUE]
+        self.unique: Dict[Tuple[int, int, int], int] = {} # (var, low, high) -> node
+        self.cache: Dict[tuple, int] = {} # results of operations
+        self.refs: Dict[int, int] = {} # node -> number of Functions
+        self.free: List[int] = [] # collected nodes, to be reused
+        self.maps: Dict[Tuple[Tuple[int, int], ...], int] = {} # renamings, interned for the cache
+        self.gc_threshold = gc_threshold
+        self.cache_limit = cache_limit
+        self.collections = 0
+
+    @property
+    def false(self) -> 'Function':
+        return Function(self, FALSE)
+
+    @property
+    def true(self) -> 'Function':
+        return Function(self, TRUE)
+
+    def add_vars(self, n: int) -> List[int]:
+        first = self.num_vars
+        self.num_vars += n
+        return list(range(first, self.num_vars))
+
+    def ensure_vars(self, n: int) -> None:
+        self.num_vars = max(self.num_vars, n)
+
+    def var_func(self, v: int) -> 'Function':
+        assert v < self.num_vars
+        return Function(self, self._mk(v, FALSE, TRUE))
+
+    def cube(self, vs: Iterable[int]) -> 'Function':
+        # the conjunction of the variables
+        u = TRUE
+        for v in sorted(vs, reverse=True):
+            u = self._mk(v, FALSE, u)
+        return Function(self, u)
+
+    def from_keys(self, vs: Sequence[int], keys: Sequence[int]) -> 'Function':
+        # the set of assignments to vs (in increasing order) given by sorted distinct ints,
+        # the highest bit of a key is the value of vs[0]
+        # built bottom-up in O(len(keys) * len(vs)), without any apply
+        n = len(vs)
+
+        def build(i: int, lo: int, hi: int, base: int) -> int:
+            if lo == hi:
+                return FALSE
+            if hi - lo == 1 << (n - i): # all assignments of the rest
+                return TRUE
+            if hi - lo == 1: # a single assignment, no more splits
+                k = keys[lo]
+                u = TRUE
+                for j in range(n - 1, i - 1, -1):
+                    u = self._mk(vs[j], FALSE, u) if k >> (n - 1 - j) & 1 else self._mk(vs[j], u, FALSE)
+                return u
+            bit = 1 << (n - 1 - i)
+            mid = bisect_left(keys, base | bit, lo, hi)
+            return self._mk(vs[i], build(i + 1, lo, mid, base), build(i + 1, mid, hi, base | bit))
+
+        return Function(self, build(0, 0, len(keys), 0))
+
+    def _mk(self, v: int, l: int, h: int) -> int:
+        if l == h:
+            return l
+        key = (v, l, h)
+        u = self.unique.get(key, None)
+        if u is None:
+            if self.free:
+                u = self.free.pop()
+                self.var[u] = v
+                self.low[u] = l
+                self.high[u] = h
+            else:
+                u = len(self.var)
+                self.var.append(v)
+                self.low.append(l)
+                self.high.append(h)
+            self.unique[key] = u
+        return u
+
+    def _cofactors(self, u: int, v: int) -> Tuple[int, int, int, int, int]:
+        # the top variable of u and v, and the cofactors of both by it
+        var = self.var
+        x = min(var[u], var[v])
+        u0, u1 = (self.low[u], self.high[u]) if var[u] == x else (u, u)
+        v0, v1 = (self.low[v], self.high[v]) if var[v] == x else (v, v)
+        return x, u0, u1, v0, v1
+
+    def _and(self, u: int, v: int) -> int:
+        if u == FALSE or v == FALSE:
+            return FALSE
+        if u == TRUE or u == v:
+            return v
+        if v == TRUE:
+            return u
+        if u > v:
+            u, v = v, u
+        key = ('&', u, v)
+        r = self.cache.get(key, None)
+        if r is None:
+            x, u0, u1, v0, v1 = self._cofactors(u, v)
+            r = self.cache[key] = self._mk(x, self._and(u0, v0), self._and(u1, v1))
+        return r
+
+    def _or(self, u: int, v: int) -> int:
+        if u == TRUE or v == TRUE:
+            return TRUE
+        if u == FALSE or u == v:
+            return v
+        if v == FALSE:
+            return u
+        if u > v:
+            u, v = v, u
+        key = ('|', u, v)
+        r = self.cache.get(key, None)
+        if r is None:
+            x, u0, u1, v0, v1 = self._cofactors(u, v)
+            r = self.cache[key] = self._mk(x, self._or(u0, v0), self._or(u1, v1))
+        return r
+
+    def _not(self, u: int) -> int:
+        if u <= TRUE:
+            return 1 - u
+        key = ('!', u)
+        r = self.cache.get(key, None)
+        if r is None:
+            r = self.cache[key] = self._mk(self.var[u], self._not(self.low[u]), self._not(self.high[u]))
+        return r
+
+    def _exist(self, u: int, cube: int) -> int:
+        var = self.var
+        if u <= TRUE:
+            return u
+        while var[cube] < var[u]: # quantified variables above u
+            cube = self.high[cube]
+        if cube == TRUE:
+            return u
+        key = ('E', u, cube)
+        r = self.cache.get(key, None)
+        if r is None:
+            if var[cube] == var[u]:
+                r = self._exist(self.low[u], self.high[cube])
+                if r != TRUE:
+                    r = self._or(r, self._exist(self.high[u], self.high[cube]))
+            else:
+                r = self._mk(var[u], self._exist(self.low[u], cube), self._exist(self.high[u], cube))
+            self.cache[key] = r
+        return r
+
+    def _and_exist(self, u: int, v: int, cube: int) -> int:
+        # exists cube. u /\ v, without building u /\ v
+        if u == FALSE or v == FALSE:
+            return FALSE
+        if u == TRUE or u == v:
+            return self._exist(v, cube)
+        if v == TRUE:
+            return self._exist(u, cube)
+        if u > v:
+            u, v = v, u
+        var = self.var
+        x = min(var[u], var[v])
+        while var[cube] < x:
+            cube = self.high[cube]
+        if cube == TRUE:
+            return self._and(u, v)
+        key = ('AE', u, v, cube)
+        r = self.cache.get(key, None)
+        if r is None:
+            x, u0, u1, v0, v1 = self._cofactors(u, v)
+            if var[cube] == x:
+                r = self._and_exist(u0, v0, self.high[cube])
+                if r != TRUE:
+                    r = self._or(r, self._and_exist(u1, v1, self.high[cube]))
+            else:
+                r = self._mk(x, self._and_exist(u0, v0, cube), self._and_exist(u1, v1, cube))
+            self.cache[key] = r
+        return r
+
+    def _rename(self, u: int, m: Dict[int, int], mid: int) -> int:
+        if u <= TRUE:
+            return u
+        key = ('R', u, mid)
+        r = self.cache.get(key, None)
+        if r is None:
+            l = self._rename(self.low[u], m, mid)
+            h = self._rename(self.high[u], m, mid)
+            v = self.var[u]
+            w = m.get(v, v)
+            # the renaming must keep the order of the variables of u
+            assert w < self.var[l] and w < self.var[h], 'renaming does not keep the variable order'
+            r = self.cache[key] = self._mk(w, l, h)
+        return r
+
+    def _start(self) -> None:
+        # called before each operation, no node is in use but those of Functions
+        if len(self.unique) > self.gc_threshold:
+            self.collect()
+            if len(self.unique) > self.gc_threshold // 2:
+                self.gc_threshold *= 2
+        if len(self.cache) > self.cache_limit:
+            self.cache.clear()
+
+    def collect(self) -> None:
+        # mark the nodes below Functions, free all others
+        marked = {FALSE, TRUE}
+        stack = list(self.refs)
+        while stack:
+            u = stack.pop()
+            if u not in marked:
+                marked.add(u)
+                stack.append(self.low[u])
+                stack.append(self.high[u])
+        live: Dict[Tuple[int, int, int], int] = {}
+        for key, u in self.unique.items():
+            if u in marked:
+                live[key] = u
+            else:
+                self.free.append(u)
+        self.unique = live
+        self.cache.clear() # may refer to freed nodes
+        self.collections += 1
+
+    def apply_and(self, f: 'Function', g: 'Function') -> 'Function':
+        self._start()
+        return Function(self, self._and(f.node, g.node))
+
+    def apply_or(self, f: 'Function', g: 'Function') -> 'Function':
+        self._start()
+        return Function(self, self._or(f.node, g.node))
+
+    def apply_not(self, f: 'Function') -> 'Function':
+        self._start()
+        return Function(self, self._not(f.node))
+
+    def exist(self, vs: Iterable[int], f: 'Function') -> 'Function':
+        cube = self.cube(vs)
+        self._start()
+        return Function(self, self._exist(f.node, cube.node))
+
+    def and_exist(self, f: 'Function', g: 'Function', vs: Iterable[int]) -> 'Function':
+        # exists vs. f /\ g, the relational product
+        cube = self.cube(vs)
+        self._start()
+        return Function(self, self._and_exist(f.node, g.node, cube.node))
+
+    def rename(self, f: 'Function', m: Dict[int, int]) -> 'Function':
+        # replace each variable v by m[v], the order of the variables must be kept
+        items = tuple(sorted(m.items()))
+        mid = self.maps.setdefault(items, len(self.maps))
+        self._start()
+        return Function(self, self._rename(f.node, m, mid))
+
+    def count(self, f: 'Function', vs: Sequence[int]) -> int:
+        # number of assignments to vs satisfying f, which must only depend on vs
+        vs = sorted(vs)
+        level = {v: i for i, v in enumerate(vs)}
+        level[TERMINAL] = len(vs)
+        memo: Dict[int, int] = {FALSE: 0, TRUE: 1}
+
+        def cnt(u: int) -> int:
+            # over the variables from that of u on
+            if u not in memo:
+                l, h = self.low[u], self.high[u]
+                lu = level[self.var[u]]
+                memo[u] = (cnt(l) << (level[self.var[l]] - lu - 1)) + (cnt(h) << (level[self.var[h]] - lu - 1))
+            return memo[u]
+
+        return cnt(f.node) << level[self.var[f.node]]
+
+    def size(self, f: 'Function') -> int:
+        # number of nodes of f, terminals included
+        seen = set()
+        stack = [f.node]
+        while stack:
+            u = stack.pop()
+            if u not in seen:
+                seen.add(u)
+                if u > TRUE:
+                    stack.append(self.low[u])
+                    stack.append(self.high[u])
+        return len(seen)
+
+
+class Function:
+    # a node kept alive for garbage collection
+
+    __slots__ = ('bdd', 'node')
+
+    def __init__(self, bdd: BDD, node: int) -> None:
+        self.bdd = bdd
+        self.node = node
+        bdd.refs[node] = bdd.refs.get(node, 0) + 1
+
+    def __del__(self) -> None:
+        refs = self.bdd.refs
+        c = refs[self.node] - 1
+        if c:
+            refs[self.node] = c
+        else:
+            del refs[self.node]
+
+    def __and__(self, other: 'Function') -> 'Function':
+        return self.bdd.apply_and(self, other)
+
+    def __or__(self, other: 'Function') -> 'Function':
+        return self.bdd.apply_or(self, other)
+
+    def __invert__(self) -> 'Function':
+        return self.bdd.apply_not(self)
+
+    def __sub__(self, other: 'Function') -> 'Function':
+        return self & ~other
+
+    def __eq__(self, other: object) -> bool:
+        # nodes are canonical
+        return isinstance(other, Function) and self.bdd is other.bdd and self.node == other.node
+
+    def __hash__(self) -> int:
+        return hash(self.node)
+
+    @property
+    def is_false(self) -> bool:
+        return self.node == FALSE
+
+    @property
+    def is_true(self) -> bool:
+        return self.node == TRUE
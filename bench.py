@@ -0,0 +1,132 @@
+# time each stage of the pipeline on generated workloads, results as JSON
+
+import argparse
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Tuple
+
+from dfs import nested_dfs
+from generator import random_ltl, random_ts
+from ltl_parser import AST, parse
+from transform import AST_to_GNBA, GNBA_to_NBA, NBA_product_TS, partial_ts
+
+
+STAGES = ['parse', 'closure', 'elementary', 'gnba', 'nba', 'product', 'emptiness']
+SWEEPS = ['states', 'branching', 'aps', 'ap_density', 'sccs', 'depth', 'untils']
+
+
+def timed(f: Callable[[], Any]) -> Tuple[Any, float]:
+    t = time.perf_counter()
+    r = f()
+    return r, time.perf_counter() - t
+
+
+def run_one(ts, ap, ltl: str) -> Dict[str, Any]:
+    # one formula through the whole pipeline, as main.check_ltl does
+    times: Dict[str, float] = {}
+    root, times['parse'] = timed(lambda: parse(f'!({ltl})'))
+    ast, times['closure'] = timed(lambda: AST(root=root))
+    elementary, times['elementary'] = timed(ast.get_elementary_masks)
+    gnba, times['gnba'] = timed(lambda: AST_to_GNBA(ast))
+    nba, times['nba'] = timed(lambda: GNBA_to_NBA(gnba))
+    prod, times['product'] = timed(lambda: NBA_product_TS(nba, partial_ts(ts, ast, ap)))
+    ok, times['emptiness'] = timed(lambda: nested_dfs(prod, nba))
+    edges = list(prod.iter_trans())
+    return {
+        'ltl': ltl,
+        'times': times,
+        'closure': len(ast.closure),
+        'elementary': len(elementary),
+        'gnba_states': len(gnba.Q),
+        'gnba_sets': len(gnba.F),
+        'nba_states': len(nba.Q),
+        'product_states': len({s for (s, _, t) in edges} | {t for (_, _, t) in edges} | set(prod.I)),
+        'product_transitions': len(edges),
+        'holds': ok,
+    }
+
+
+def run_point(point: Dict[str, Any], args: argparse.Namespace, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    ts, ap = random_ts(point['states'], point['branching'], point['aps'], point['ap_density'],
+                       point['sccs'], args.actions, rng=rng)
+    runs = [run_one(ts, ap, random_ltl(point['depth'], point['aps'], point['untils'], rng=rng))
+            for _ in range(args.formulas)]
+    total = {s: sum(r['times'][s] for r in runs) for s in STAGES}
+    return {'params': point, 'seed': seed, 'total': total, 'runs': runs}
+
+
+def sweep_points(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    # the cartesian product of all swept parameters
+    values = [getattr(args, k) for k in SWEEPS]
+    return [dict(zip(SWEEPS, v)) for v in itertools.product(*values)]
+
+
+def compare(old_file: str, new_file: str) -> None:
+    # speedup per stage of the points present in both files
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    key = lambda r: json.dumps(r['params'], sort_keys=True)
+    before = {key(r): r for r in old['results']}
+    print('params'.ljust(40) + ''.join(s.rjust(11) for s in STAGES))
+    for r in new['results']:
+        b = before.get(key(r))
+        if b is None:
+            continue
+        p = ' '.join(f'{k}={v}' for k, v in r['params'].items())
+        row = ''
+        for s in STAGES:
+            t0, t1 = b['total'][s], r['total'][s]
+            row += (f'{t0 / t1:10.2f}x' if t1 > 0 else '          -')
+        print(p[:39].ljust(40) + row)
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--states', type=int, nargs='+', default=[100])
+    parser.add_argument('--branching', type=float, nargs='+', default=[2.0])
+    parser.add_argument('--aps', type=int, nargs='+', default=[3])
+    parser.add_argument('--ap-density', type=float, nargs='+', default=[0.3])
+    parser.add_argument('--sccs', type=int, nargs='+', default=[1])
+    parser.add_argument('--depth', type=int, nargs='+', default=[3])
+    parser.add_argument('--untils', type=int, nargs='+', default=[1])
+    parser.add_argument('--actions', type=int, default=3)
+    parser.add_argument('--formulas', type=int, default=5, help='formulae per point')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', type=str, default=None, help='write the results as JSON')
+    parser.add_argument('--compare', type=str, nargs=2, default=None, metavar=('OLD', 'NEW'),
+                        help='compare the stage times of two result files')
+    return parser
+
+
+if __name__ == '__main__':
+    args = make_parser().parse_args()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    results = []
+    for point in sweep_points(args):
+        # the workload of a point does not depend on the rest of the sweep
+        seed = args.seed ^ zlib.crc32(json.dumps(point, sort_keys=True).encode())
+        r = run_point(point, args, seed)
+        results.append(r)
+        p = ' '.join(f'{k}={v}' for k, v in point.items())
+        print(p + '  ' + ' '.join(f'{s}={r["total"][s]:.4f}' for s in STAGES))
+    if args.output:
+        meta = {
+            'argv': sys.argv[1:],
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'stages': STAGES,
+        }
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=1)
@@ -0,0 +1,118 @@
+# cache of translated automata
+# an in-process LRU, optionally backed by a directory of pickled automata,
+# keyed by the canonical form of the formula
+
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Optional
+
+from ltl_parser import AST
+
+
+CACHE_VERSION = 7 # bump whenever the translation or the automaton classes change
+DEFAULT_CAPACITY = 256 # automata kept in memory
+DEFAULT_MAX_BYTES = 1 << 30 # size of the directory
+
+
+class AutomatonCache:
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, path: Optional[str] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.capacity = capacity
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lru: OrderedDict[str, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock() # the LRU is shared by the threads of the server
+
+    @staticmethod
+    def key(ast: AST, kind: str) -> str:
+        # kind tells apart the different automata of the same formula
+        # (e.g. GNBA or NBA, and how they are built)
+        return f'{kind}\n{ast._polish()}\n{ast._middle()}'
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, hashlib.sha1(key.encode()).hexdigest() + '.pkl')
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                self.hits += 1
+                return self.lru[key]
+        aut = self._load(key)
+        if aut is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, aut)
+        return aut
+
+    def put(self, key: str, aut: Any) -> None:
+        self._remember(key, aut)
+        if self.path is not None:
+            self._store(key, aut)
+
+    def _remember(self, key: str, aut: Any) -> None:
+        with self.lock:
+            self.lru[key] = aut
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.capacity:
+                self.lru.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Any]:
+        if self.path is None:
+            return None
+        file = self._file(key)
+        try:
+            with open(file, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None # missing or unreadable
+        if entry.get('version') != CACHE_VERSION or entry.get('key') != key:
+            # stale entry, or a collision of the file names
+            self._remove(file)
+            return None
+        os.utime(file) # the modification time serves as the last access time
+        return entry['automaton']
+
+    def _store(self, key: str, aut: Any) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        file = self._file(key)
+        tmp = f'{file}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'key': key, 'automaton': aut}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file)
+        self._evict()
+
+    def _evict(self) -> None:
+        # remove the least recently used files until the directory fits into max_bytes
+        files = []
+        total = 0
+        for name in os.listdir(self.path):
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError: # removed by another process
+                continue
+            files.append((st.st_mtime_ns, st.st_size, name))
+            total += st.st_size
+        files.sort()
+        for _, size, name in files:
+            if total <= self.max_bytes:
+                break
+            self._remove(os.path.join(self.path, name))
+            total -= size
+
+    @staticmethod
+    def _remove(file: str) -> None:
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
@@ -1,70 +1,276 @@
-# nested DFS
+# emptiness checks of the product
+# nested DFS for NBA (textbook and linear), SCC-based for GNBA,
+# and the set of all states from which an accepting cycle is reachable
 
-from typing import Hashable, List, Set, Tuple, TypeVar
-from structure import NBA, TS
+from typing import Dict, Hashable, Iterator, List, Optional, Set, Tuple, TypeVar, Union
+from structure import GNBA, NBA, TS
+from por import ReducedProduct
+from transform import LazyProduct
 
 
 M = TypeVar('M', bound=Hashable)
 N = TypeVar('N', bound=Hashable)
 
+# colors of states in nested_dfs, unvisited states have no color
+CYAN = 1 # on the stack of the blue search
+BLUE = 2 # blue search finished
+RED = 3 # visited by some red search
 
-def check(ts: TS[Tuple[M, int]], nba: NBA[N]) -> bool:
-    R: Set[Tuple[M, int]] = set()
-    U: List[Tuple[M, int]] = []
-    I = set(ts.I)
-    cycle = False
 
-    def post(s: Tuple[M, int]) -> Set[Tuple[M, int]]:
-        P: Set[Tuple[M, int]] = set()
-        for a in range(ts.action_set.num_str):
-            t = ts.trans_map.get((s, a), [])
-            P.update(t)
-        return P
+def _count(stats: Optional[Dict[str, int]], name: str, value: int) -> None:
+    # counters of the search, if asked for
+    if stats is not None:
+        stats[name] = stats.get(name, 0) + value
+
+
+def check(ts: Union[TS[Tuple[M, int]], LazyProduct[M]], nba: NBA[N],
+          stats: Optional[Dict[str, int]] = None) -> bool:
+    # ts is either the materialized product or a lazy one
+    # whose states are generated on demand
+    # each stack entry keeps an iterator over the successors as its cursor,
+    # so every edge is examined once per search
+    # stats counts the states visited by the outer and by all inner searches
+    R: Set[Tuple[M, int]] = set()
+    F = {nba.state_map[f] for f in nba.F}
 
     def cycle_check(s: Tuple[M, int]) -> bool:
-        nonlocal cycle
-        T: set[Tuple[M, int]] = {s}
-        V: list[Tuple[M, int]] = [s]
-        while True:
-            ss = V[-1]
-            P = post(ss)
-            PP = P - T
-            if s in P:
-                cycle = True
-            elif PP:
-                sss = next(iter(PP))
-                V.append(sss)
-                T.add(sss)
+        T: Set[Tuple[M, int]] = {s}
+        V: List[Tuple[Tuple[M, int], Iterator[Tuple[M, int]]]] = [(s, iter(ts.post(s)))]
+        try:
+            while V:
+                _, it = V[-1]
+                for t in it:
+                    if t == s:
+                        return True
+                    if t not in T:
+                        T.add(t)
+                        V.append((t, iter(ts.post(t))))
+                        break
+                else:
+                    V.pop()
+            return False
+        finally:
+            _count(stats, 'inner_searches', 1)
+            _count(stats, 'inner_visited', len(T))
+
+    def reachable_cycle(s: Tuple[M, int]) -> bool:
+        R.add(s)
+        U: List[Tuple[Tuple[M, int], Iterator[Tuple[M, int]]]] = [(s, iter(ts.post(s)))]
+        while U:
+            ss, it = U[-1]
+            for t in it:
+                if t not in R:
+                    R.add(t)
+                    U.append((t, iter(ts.post(t))))
+                    break
+            else:
+                U.pop()
+                if ss[1] in F and cycle_check(ss):
+                    return True
+        return False
+
+    try:
+        for s in ts.I:
+            if s not in R and reachable_cycle(s):
+                return False
+        return True
+    finally:
+        _count(stats, 'outer_visited', len(R))
+
+
+def nested_dfs(ts: Union[TS[Tuple[M, int]], LazyProduct[M]], nba: NBA[N],
+               stats: Optional[Dict[str, int]] = None) -> bool:
+    # the nested DFS of Schwoon and Esparza, linear in the size of the product:
+    # all red searches share their visited states (RED),
+    # and any edge back to the blue stack (CYAN) closing a cycle
+    # through an accepting state is reported at once
+    # stats counts the states visited by the blue and by all red searches
+    # a ReducedProduct is explored through its ample sets, with the blue stack as cycle proviso
+    F = {nba.state_map[f] for f in nba.F}
+    color: Dict[Tuple[M, int], int] = {}
+    try:
+        return _nested_dfs(ts, F, color)
+    finally:
+        if stats is not None:
+            _count(stats, 'blue_visited', len(color))
+            _count(stats, 'red_visited', sum(1 for c in color.values() if c == RED))
+
+
+def _nested_dfs(ts: Union[TS[Tuple[M, int]], LazyProduct[M]], F: Set[int],
+                color: Dict[Tuple[M, int], int]) -> bool:
+
+    def blue_post(s: Tuple[M, int]) -> List[Tuple[M, int]]:
+        if isinstance(ts, ReducedProduct):
+            return ts.ample(s, lambda t: color.get(t, None) == CYAN)
+        return ts.post(s)
+
+    def red(s: Tuple[M, int]) -> bool:
+        V: List[Iterator[Tuple[M, int]]] = [iter(ts.post(s))]
+        while V:
+            for t in V[-1]:
+                c = color.get(t, None)
+                if c == CYAN:
+                    return True
+                if c == BLUE:
+                    color[t] = RED
+                    V.append(iter(ts.post(t)))
+                    break
             else:
                 V.pop()
-            if len(V) == 0 or cycle:
-                break
-        return cycle
+        return False
 
-    def reachable_cycle(s: Tuple[M, int]) -> None:
-        nonlocal cycle
-        U.append(s)
-        R.add(s)
-        while True:
-            ss = U[-1]
-            P = post(ss)
-            PP = P - R
-            if PP:
-                sss = next(iter(PP))
-                U.append(sss)
-                R.add(sss)
+    for s0 in ts.I:
+        if s0 in color:
+            continue
+        color[s0] = CYAN
+        U: List[Tuple[Tuple[M, int], Iterator[Tuple[M, int]]]] = [(s0, iter(blue_post(s0)))]
+        while U:
+            s, it = U[-1]
+            for t in it:
+                c = color.get(t, None)
+                if c == CYAN and (s[1] in F or t[1] in F):
+                    return False
+                if c is None:
+                    color[t] = CYAN
+                    U.append((t, iter(blue_post(t))))
+                    break
             else:
                 U.pop()
-                for f in nba.F:
-                    if ss[1] == nba.state_map[f]:
-                        cycle = cycle_check(ss)
-            if len(U) == 0 or cycle:
-                break
-
-    II = I - R
-    while II and not cycle:
-        s = next(iter(II))
-        reachable_cycle(s)
-        II = I - R
-    
-    return not cycle
+                if s[1] in F:
+                    if red(s):
+                        return False
+                    color[s] = RED
+                else:
+                    color[s] = BLUE
+    return True
+
+
+def acceptance_masks(aut: Union[NBA[N], GNBA[N]]) -> Tuple[Dict[int, int], int]:
+    # state id -> bitmask of the acceptance sets containing it, and the full mask
+    # an NBA has a single acceptance set
+    Fs = [aut.F] if isinstance(aut, NBA) else aut.F
+    acc_of: Dict[int, int] = {}
+    for j, f in enumerate(Fs):
+        for q in f:
+            i = aut.state_map[q]
+            acc_of[i] = acc_of.get(i, 0) | (1 << j)
+    return acc_of, (1 << len(Fs)) - 1
+
+
+def check_scc(ts: Union[TS[Tuple[M, int]], LazyProduct[M]], gnba: GNBA[N],
+              stats: Optional[Dict[str, int]] = None) -> bool:
+    # Couvreur's on-the-fly SCC algorithm on the product of a GNBA and a TS,
+    # an SCC is accepting iff it is nontrivial and meets every set in gnba.F
+    # so that no degeneralization is needed
+    H: Dict[Tuple[M, int], int] = {} # dfs number of a state, 0 once its SCC is done
+    try:
+        return _check_scc(ts, gnba, H)
+    finally:
+        _count(stats, 'visited', len(H))
+
+
+def _check_scc(ts: Union[TS[Tuple[M, int]], LazyProduct[M]], gnba: GNBA[N],
+               H: Dict[Tuple[M, int], int]) -> bool:
+    acc_of, full = acceptance_masks(gnba)
+    roots: List[Tuple[int, int]] = [] # (dfs number, acceptance sets met) of SCC roots
+    active: List[Tuple[M, int]] = [] # states whose SCC is not done
+    todo: List[Tuple[Tuple[M, int], Iterator[Tuple[M, int]]]] = []
+
+    def push(s: Tuple[M, int]) -> None:
+        H[s] = len(H) + 1
+        roots.append((H[s], acc_of.get(s[1], 0)))
+        active.append(s)
+        todo.append((s, iter(ts.post(s))))
+
+    for s0 in ts.I:
+        if s0 in H:
+            continue
+        push(s0)
+        while todo:
+            s, it = todo[-1]
+            t = next(it, None)
+            if t is None:
+                todo.pop()
+                if roots[-1][0] == H[s]:
+                    # s is the root of a maximal SCC
+                    roots.pop()
+                    while True:
+                        u = active.pop()
+                        H[u] = 0
+                        if u == s:
+                            break
+            elif t not in H:
+                push(t)
+            elif H[t] > 0:
+                # t is in the same SCC as s, merge all roots above t
+                acc = 0
+                while H[t] < roots[-1][0]:
+                    acc |= roots.pop()[1]
+                roots[-1] = (roots[-1][0], roots[-1][1] | acc)
+                if roots[-1][1] == full:
+                    return False
+    return True
+
+
+def bad_states(ts: Union[TS[Tuple[M, int]], LazyProduct[M]], aut: Union[NBA[N], GNBA[N]],
+               stats: Optional[Dict[str, int]] = None) -> Set[Tuple[M, int]]:
+    # all states reachable from ts.I that can reach an accepting cycle
+    # Tarjan's algorithm finishes SCCs in reverse topological order, so when an SCC
+    # is done, all its successors outside of it are already decided
+    acc_of, full = acceptance_masks(aut)
+    index: Dict[Tuple[M, int], int] = {}
+    low: Dict[Tuple[M, int], int] = {}
+    on_stack: Set[Tuple[M, int]] = set()
+    stack: List[Tuple[M, int]] = []
+    bad: Set[Tuple[M, int]] = set()
+    todo: List[Tuple[Tuple[M, int], Iterator[Tuple[M, int]]]] = []
+
+    def push(s: Tuple[M, int]) -> None:
+        index[s] = low[s] = len(index)
+        stack.append(s)
+        on_stack.add(s)
+        todo.append((s, iter(ts.post(s))))
+
+    for s0 in ts.I:
+        if s0 in index:
+            continue
+        push(s0)
+        while todo:
+            s, it = todo[-1]
+            for t in it:
+                if t not in index:
+                    push(t)
+                    break
+                if t in on_stack:
+                    low[s] = min(low[s], index[t])
+            else:
+                todo.pop()
+                if todo:
+                    u = todo[-1][0]
+                    low[u] = min(low[u], low[s])
+                if low[s] != index[s]:
+                    continue
+                # s is the root of an SCC
+                scc: List[Tuple[M, int]] = []
+                while True:
+                    u = stack.pop()
+                    on_stack.discard(u)
+                    scc.append(u)
+                    if u == s:
+                        break
+                members = set(scc)
+                acc = 0
+                nontrivial = len(scc) > 1
+                reach_bad = False
+                for u in scc:
+                    acc |= acc_of.get(u[1], 0)
+                    for t in ts.post(u):
+                        if t in members:
+                            nontrivial = True
+                        elif t in bad:
+                            reach_bad = True
+                if reach_bad or (nontrivial and acc == full):
+                    bad.update(scc)
+    _count(stats, 'visited', len(index))
+    _count(stats, 'bad', len(bad))
+    return bad
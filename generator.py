@@ -0,0 +1,129 @@
+# random transition systems and LTL formulae for benchmarking
+
+import argparse
+import random
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from reader import write_BM, write_TS
+from structure import CompactTS, StrMap, make_labels
+
+
+# relative weights of the operators in random formulae
+DEFAULT_WEIGHTS = {
+    '!': 1.0, 'X': 1.0, 'F': 1.0, 'G': 1.0,
+    '/\\': 1.0, '\\/': 1.0, '->': 1.0, 'U': 1.0,
+}
+UNARY = ['!', 'X', 'F', 'G']
+BINARY = ['/\\', '\\/', '->', 'U']
+# APs are single letters in the grammar, but the uppercase F, G, U and X are operators
+AP_NAMES = 'abcdefghijklmnopqrstuvwxyzABCDEHIJKLMNOPQRSTVWYZ'
+
+
+def random_ts(num_states: int, branching: float = 2.0, num_ap: int = 3, ap_density: float = 0.3,
+              num_sccs: int = 1, num_actions: int = 3, num_init: int = 1,
+              rng: Optional[random.Random] = None) -> Tuple[CompactTS, StrMap]:
+    # the states are split into num_sccs consecutive blocks, each strongly connected by a cycle,
+    # every other transition stays in its block or leads to a later one,
+    # so that the blocks are exactly the SCCs
+    # every state has branching transitions on average, and each AP holds with probability ap_density
+    rng = rng or random.Random()
+    bounds = [num_states * i // num_sccs for i in range(num_sccs + 1)]
+    src = array('i')
+    act = array('i')
+    dst = array('i')
+    for b in range(num_sccs):
+        lo, hi = bounds[b], bounds[b + 1]
+        for s in range(lo, hi):
+            # the cycle of the block
+            src.append(s)
+            act.append(rng.randrange(num_actions))
+            dst.append(s + 1 if s + 1 < hi else lo)
+            for _ in range(max(0, round(rng.expovariate(1 / branching)) - 1) if branching > 1 else 0):
+                src.append(s)
+                act.append(rng.randrange(num_actions))
+                dst.append(rng.randrange(lo, hi) if rng.random() < 0.8 else rng.randrange(lo, num_states))
+    labels = []
+    for s in range(num_states):
+        m = 0
+        for i in range(num_ap):
+            if rng.random() < ap_density:
+                m |= 1 << i
+        labels.append(m)
+    ts = CompactTS.from_edges(num_states, src, act, dst, make_labels(labels, num_ap))
+    for a in range(num_actions):
+        ts.action_set.add(f'a{a}')
+    ts.I = sorted(rng.sample(range(num_states), min(num_init, num_states)))
+    ap = StrMap()
+    for i in range(num_ap):
+        ap.add(ap_name(i))
+    return ts, ap
+
+
+def ap_name(i: int) -> str:
+    if not 0 <= i < len(AP_NAMES):
+        raise ValueError(f'AP {i} has no name, at most {len(AP_NAMES)} APs are supported')
+    return AP_NAMES[i]
+
+
+def random_ltl(depth: int, num_ap: int = 3, num_until: Optional[int] = None,
+               weights: Optional[Dict[str, float]] = None, rng: Optional[random.Random] = None) -> str:
+    # a random formula of at most the given depth, fully parenthesized,
+    # with exactly num_until U operators if given (F and G do not count)
+    rng = rng or random.Random()
+    weights = weights or DEFAULT_WEIGHTS
+    capacity = lambda d: (1 << d) - 1 # binary operators that fit into depth d
+    if num_until is not None and num_until > capacity(depth):
+        raise ValueError(f'{num_until} untils do not fit into depth {depth}')
+
+    def gen(d: int, k: Optional[int]) -> str:
+        if d == 0 or (not k and rng.random() < 0.2):
+            return ap_name(rng.randrange(num_ap))
+        ops = [o for o in UNARY + BINARY if weights.get(o, 0) > 0]
+        if k is not None:
+            # keep exactly k untils in the remaining depth
+            ops = [o for o in ops if
+                   (o in UNARY and k <= capacity(d - 1)) or
+                   (o == 'U' and 0 < k <= 2 * capacity(d - 1) + 1) or
+                   (o in BINARY and o != 'U' and k <= 2 * capacity(d - 1))]
+        if not ops:
+            return ap_name(rng.randrange(num_ap))
+        o = rng.choices(ops, [weights[o] for o in ops])[0]
+        if o in UNARY:
+            return f'{o}({gen(d - 1, k)})'
+        if k is None:
+            k1 = k2 = None
+        else:
+            rest = k - (o == 'U')
+            k1 = rng.randint(max(0, rest - capacity(d - 1)), min(rest, capacity(d - 1)))
+            k2 = rest - k1
+        return f'({gen(d - 1, k1)}) {o} ({gen(d - 1, k2)})'
+
+    return gen(depth, num_until)
+
+
+if __name__ == '__main__':
+    # write a random TS and benchmark in the input format of main.py
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-ts', type=str, default='random_TS.txt')
+    parser.add_argument('-bm', '--benchmark', type=str, default='random_benchmark.txt')
+    parser.add_argument('--states', type=int, default=100)
+    parser.add_argument('--branching', type=float, default=2.0)
+    parser.add_argument('--aps', type=int, default=3)
+    parser.add_argument('--ap-density', type=float, default=0.3)
+    parser.add_argument('--sccs', type=int, default=1)
+    parser.add_argument('--actions', type=int, default=3)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--untils', type=int, default=None)
+    parser.add_argument('--formulas', type=int, default=10, help='formulae checked on all initial states')
+    parser.add_argument('--queries', type=int, default=10, help='formulae checked on a single state')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ts, ap = random_ts(args.states, args.branching, args.aps, args.ap_density, args.sccs, args.actions, rng=rng)
+    write_TS(ts, ap, args.ts)
+    formula = lambda: random_ltl(args.depth, args.aps, args.untils, rng=rng)
+    ltl_all: List[str] = [formula() for _ in range(args.formulas)]
+    ltl_state = [(rng.randrange(args.states), formula()) for _ in range(args.queries)]
+    write_BM(ltl_all, ltl_state, args.benchmark)
@@ -0,0 +1,57 @@
+# parser for LTL formula using antlr tree
+# only imported on demand, loading the antlr4 runtime takes a while
+
+from typing import List
+
+from antlr4 import *
+from antlr4.error.ErrorListener import ErrorListener
+
+from antlr.ltlParser import ltlParser
+from antlr.ltlLexer import ltlLexer
+from antlr.ltlVisitor import ltlVisitor
+from ltl_node import APNode, Node
+from ltl_parser import LTLSyntaxError, make_binary, make_unary
+
+
+class ASTBuilder(ltlVisitor):
+
+    def visitParFormula(self, ctx: ltlParser.ParFormulaContext) -> Node:
+        return self.visit(ctx.child)
+
+    def visitAp(self, ctx: ltlParser.ApContext) -> Node:
+        return APNode(ap=ctx.getText())
+
+    def visitUnaryExpr(self, ctx: ltlParser.UnaryExprContext) -> Node:
+        return make_unary(ctx.op.text, self.visit(ctx.child))
+
+    def visitBinaryExpr(self, ctx: ltlParser.BinaryExprContext) -> Node:
+        return make_binary(ctx.op.text, self.visit(ctx.lhs), self.visit(ctx.rhs))
+
+
+class ErrorCollector(ErrorListener):
+    # keep the syntax errors for the exception instead of printing them
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.errors: List[str] = []
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e) -> None:
+        self.errors.append(f'line {line}:{column} {msg}')
+
+
+def parse(ltl: str) -> Node:
+    input_stream = InputStream(ltl)
+    lexer = ltlLexer(input_stream)
+    tokens = CommonTokenStream(lexer)
+    parser = ltlParser(tokens)
+    errors = ErrorCollector()
+    for recognizer in (lexer, parser):
+        recognizer.removeErrorListeners()
+        recognizer.addErrorListener(errors)
+    tree = parser.formula()
+    if tokens.LA(1) != Token.EOF: # the grammar has no EOF anchor
+        errors.errors.append(f'extraneous input {tokens.LT(1).text!r} after the formula')
+    if errors.errors:
+        # the recovered tree has missing children, no AST is built from it
+        raise LTLSyntaxError('; '.join(errors.errors))
+    return ASTBuilder().visit(tree)
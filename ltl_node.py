@@ -2,7 +2,10 @@
 
 from __future__ import annotations
 from enum import Enum
-from typing import List
+from itertools import count
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+from weakref import WeakValueDictionary
 
 
 class UNARY_OP(Enum):
@@ -17,6 +20,7 @@ class BINARY_OP(Enum):
     OR = 1
     IMP = 2
     UTL = 3
+    RLS = 4 # release, only used in negation normal form
 
 
 OP_DICT = {
@@ -40,6 +44,7 @@ INV_OP_DICT = {
     BINARY_OP.OR: '\\/',
     BINARY_OP.IMP: '->',
     BINARY_OP.UTL: 'U',
+    BINARY_OP.RLS: 'R',
 }
 
 
@@ -47,8 +52,34 @@ def is_commutable(o: BINARY_OP) -> bool:
     return o == BINARY_OP.AND or o == BINARY_OP.OR
 
     
+# hash-consing: structurally equal nodes are the same object,
+# so that equality is identity and hashes are computed once
+_table: WeakValueDictionary = WeakValueDictionary()
+_lock = Lock()
+_uids = count()
+
+
 class Node:
     # interface
+    __slots__ = ('uid', '_hash', '_canon', '__weakref__')
+
+    @classmethod
+    def _intern(cls, key: Tuple, init: Callable[[Node], None]) -> Node:
+        # return the node of key, call init on it only if it is new
+        with _lock:
+            node = _table.get(key, None)
+            if node is None:
+                node = object.__new__(cls)
+                init(node)
+                node.uid = next(_uids)
+                node._canon = node._canonical()
+                node._hash = hash(key) # the key holds the uids of the operands
+                _table[key] = node
+            return node
+
+    def _canonical(self) -> Tuple:
+        # the canonical form, built from the cached ones of the operands
+        return ()
 
     def _polish(self) -> List[str]:
         # return the Polish notation
@@ -59,11 +90,10 @@ class Node:
         return []
 
     def __hash__(self) -> int:
-        # detemine the formula by its Polish notation and middle notation
-        return tuple(self._polish() + self._middle()).__hash__()
+        return self._hash
 
     def __eq__(self, __o: object) -> bool:
-        return self.__hash__() == __o.__hash__()
+        return self is __o
 
     def __str__(self) -> str:
         return ''
@@ -74,9 +104,18 @@ class Node:
 
 
 class LiteralNode(Node):
+    __slots__ = ('literal',)
+
+    def __new__(cls, literal: bool) -> LiteralNode:
+        def init(n: LiteralNode) -> None:
+            n.literal = literal
+        return cls._intern(('lit', literal), init)
+
+    def __reduce__(self) -> Tuple:
+        return LiteralNode, (self.literal,)
 
-    def __init__(self, literal: bool) -> None:
-        self.literal = literal
+    def _canonical(self) -> Tuple:
+        return (str(self.literal),)
 
     def _polish(self) -> List[str]:
         return [str(self.literal)]
@@ -92,9 +131,18 @@ class LiteralNode(Node):
 
 
 class APNode(Node):
+    __slots__ = ('ap',)
 
-    def __init__(self, ap: str) -> None:
-        self.ap = ap
+    def __new__(cls, ap: str) -> APNode:
+        def init(n: APNode) -> None:
+            n.ap = ap
+        return cls._intern(('ap', ap), init)
+
+    def __reduce__(self) -> Tuple:
+        return APNode, (self.ap,)
+
+    def _canonical(self) -> Tuple:
+        return (self.ap,)
 
     def _polish(self) -> List[str]:
         return [self.ap]
@@ -110,11 +158,20 @@ class APNode(Node):
 
 
 class UnaryNode(Node):
+    __slots__ = ('op', 'op_str', 'oprand')
+
+    def __new__(cls, op: UNARY_OP, opr: Node = None) -> UnaryNode:
+        def init(n: UnaryNode) -> None:
+            n.op = op
+            n.op_str = INV_OP_DICT[op]
+            n.oprand = opr
+        return cls._intern((op, opr.uid), init)
+
+    def __reduce__(self) -> Tuple:
+        return UnaryNode, (self.op, self.oprand)
 
-    def __init__(self, op: UNARY_OP, opr: Node = None) -> None:
-        self.op = op
-        self.op_str = INV_OP_DICT[op]
-        self.oprand = opr
+    def _canonical(self) -> Tuple:
+        return (self.op_str, self.oprand._canon)
 
     def _polish(self) -> List[str]:
         return [self.op_str] + self.oprand._polish()
@@ -130,15 +187,26 @@ class UnaryNode(Node):
 
 
 class BinaryNode(Node):
-
-    def __init__(self, op: BINARY_OP, opr1: Node = None, opr2: Node = None) -> None:
-        self.op = op
-        self.op_str = INV_OP_DICT[op]
-        self.oprand1 = opr1
-        self.oprand2 = opr2
-        if is_commutable(op) and hash(self.oprand1) > hash(self.oprand2):
-            self.oprand1 = opr2
-            self.oprand2 = opr1
+    __slots__ = ('op', 'op_str', 'oprand1', 'oprand2')
+
+    def __new__(cls, op: BINARY_OP, opr1: Node = None, opr2: Node = None) -> BinaryNode:
+        def init(n: BinaryNode) -> None:
+            n.op = op
+            n.op_str = INV_OP_DICT[op]
+            n.oprand1 = opr1
+            n.oprand2 = opr2
+            if is_commutable(op) and canonical(opr1) > canonical(opr2):
+                n.oprand1 = opr2
+                n.oprand2 = opr1
+        if is_commutable(op): # the key does not depend on the order
+            return cls._intern((op, min(opr1.uid, opr2.uid), max(opr1.uid, opr2.uid)), init)
+        return cls._intern((op, opr1.uid, opr2.uid), init)
+
+    def __reduce__(self) -> Tuple:
+        return BinaryNode, (self.op, self.oprand1, self.oprand2)
+
+    def _canonical(self) -> Tuple:
+        return (self.op_str, self.oprand1._canon, self.oprand2._canon)
 
     def _polish(self) -> List[str]:
         return [self.op_str] + self.oprand1._polish() + self.oprand2._polish()
@@ -153,6 +221,13 @@ class BinaryNode(Node):
         return self.oprand1._sub() + self.oprand2._sub() + [self]
      
 
+def canonical(n: Node) -> Tuple:
+    # unlike hash(), this is stable between runs,
+    # so operands of commutable operators are ordered the same way every time
+    # nested tuples sharing those of the operands, so each node adds O(1)
+    return n._canon
+
+
 TRUE_NODE = LiteralNode(True)
 FALSE_NODE = LiteralNode(False)
 
@@ -166,3 +241,133 @@ def get_neg(n: Node) -> Node:
     if isinstance(n, UnaryNode) and n.op == UNARY_OP.NOT:
         return n.oprand
     return UnaryNode(op=UNARY_OP.NOT, opr=n)
+
+
+def get_nnf(n: Node, neg: bool = False) -> Node:
+    # negation normal form of n (or !n if neg), using OR and RLS
+    # so that negations only occur in front of APs
+    if isinstance(n, LiteralNode):
+        return LiteralNode(n.literal != neg)
+    if isinstance(n, APNode):
+        return UnaryNode(op=UNARY_OP.NOT, opr=n) if neg else n
+    if isinstance(n, UnaryNode):
+        if n.op == UNARY_OP.NOT:
+            return get_nnf(n.oprand, not neg)
+        if n.op == UNARY_OP.NXT: # !X a === X !a
+            return UnaryNode(op=UNARY_OP.NXT, opr=get_nnf(n.oprand, neg))
+        raise ValueError(f'Unexpected unary op: {n.op_str}')
+    if isinstance(n, BinaryNode):
+        dual = {
+            BINARY_OP.AND: BINARY_OP.OR,
+            BINARY_OP.OR: BINARY_OP.AND,
+            BINARY_OP.UTL: BINARY_OP.RLS,
+            BINARY_OP.RLS: BINARY_OP.UTL,
+        }
+        if n.op not in dual:
+            raise ValueError(f'Unexpected binary op: {n.op_str}')
+        return BinaryNode(
+            op=dual[n.op] if neg else n.op,
+            opr1=get_nnf(n.oprand1, neg),
+            opr2=get_nnf(n.oprand2, neg)
+        )
+    raise ValueError(f'Unexpected node: {n}')
+
+
+# simplification of formulae in the form built by the parser (NOT, NXT, AND, UTL),
+# where F b is true U b and G b is !(true U !b)
+# every rule makes the formula smaller, so rewriting terminates
+
+def _is(n: Node, op: Enum) -> bool:
+    return isinstance(n, (UnaryNode, BinaryNode)) and n.op == op
+
+
+def _eventually(n: Node) -> Optional[Node]:
+    # b if n is F b
+    if _is(n, BINARY_OP.UTL) and n.oprand1 == TRUE_NODE:
+        return n.oprand2
+    return None
+
+
+def _always(n: Node) -> Optional[Node]:
+    # b if n is G b
+    if _is(n, UNARY_OP.NOT):
+        b = _eventually(n.oprand)
+        if b is not None:
+            return get_neg(b)
+    return None
+
+
+def _rewrite(n: Node) -> Node:
+    # one rule at the root of n, whose operands are simplified
+    if _is(n, UNARY_OP.NXT) and isinstance(n.oprand, LiteralNode): # X true === true
+        return n.oprand
+    if _is(n, BINARY_OP.AND):
+        a, b = n.oprand1, n.oprand2
+        if a == b: # a /\ a === a
+            return a
+        for x, y in ((a, b), (b, a)):
+            if x == FALSE_NODE or x == get_neg(y): # a /\ false === a /\ !a === false
+                return FALSE_NODE
+            if x == TRUE_NODE:
+                return y
+            if _is(y, UNARY_OP.NOT) and _is(y.oprand, BINARY_OP.AND):
+                u, v = y.oprand.oprand1, y.oprand.oprand2
+                if get_neg(x) in (u, v): # a /\ (a \/ b) === a
+                    return x
+                if x in (u, v): # a /\ !(a /\ b) === a /\ !b
+                    return BinaryNode(op=BINARY_OP.AND, opr1=x, opr2=get_neg(v if x == u else u))
+        if _is(a, UNARY_OP.NXT) and _is(b, UNARY_OP.NXT): # X a /\ X b === X (a /\ b)
+            return UnaryNode(op=UNARY_OP.NXT, opr=BinaryNode(op=BINARY_OP.AND, opr1=a.oprand, opr2=b.oprand))
+    if _is(n, BINARY_OP.UTL):
+        a, b = n.oprand1, n.oprand2
+        if isinstance(b, LiteralNode) or a == FALSE_NODE or a == b: # a U true === true, false U b === b
+            return b
+        if _is(b, BINARY_OP.UTL) and b.oprand1 in (a, TRUE_NODE): # a U (a U b) === a U F b === F b
+            return b
+        if _is(a, BINARY_OP.UTL) and a.oprand2 == b: # (a U b) U b === a U b
+            return a
+        if _is(a, UNARY_OP.NXT) and _is(b, UNARY_OP.NXT): # X a U X b === X (a U b)
+            return UnaryNode(op=UNARY_OP.NXT, opr=BinaryNode(op=BINARY_OP.UTL, opr1=a.oprand, opr2=b.oprand))
+        if a == TRUE_NODE:
+            if _is(b, BINARY_OP.UTL): # F (a U b) === F b
+                return BinaryNode(op=BINARY_OP.UTL, opr1=TRUE_NODE, opr2=b.oprand2)
+            c = _always(b)
+            if c is not None and _eventually(c) is not None: # F G F b === G F b
+                return b
+            if _is(b, UNARY_OP.NOT) and _is(b.oprand, BINARY_OP.AND):
+                # F (a \/ F b) === F (a \/ b), a \/ b being !(!a /\ !b)
+                u, v = b.oprand.oprand1, b.oprand.oprand2
+                u_, v_ = (get_neg(_eventually(x.oprand)) if _is(x, UNARY_OP.NOT) and _eventually(x.oprand) is not None
+                          else x for x in (u, v))
+                if (u_, v_) != (u, v):
+                    return BinaryNode(op=BINARY_OP.UTL, opr1=TRUE_NODE,
+                                      opr2=get_neg(BinaryNode(op=BINARY_OP.AND, opr1=u_, opr2=v_)))
+    c = _always(n)
+    if c is not None:
+        d = _eventually(c)
+        if d is not None and _always(d) is not None: # G F G b === F G b
+            return c
+    return n
+
+
+def simplify(n: Node) -> Node:
+    # rewrite n bottom-up until no rule applies
+    memo: Dict[Node, Node] = {}
+
+    def rec(n: Node) -> Node:
+        r = memo.get(n, None)
+        if r is None:
+            if isinstance(n, UnaryNode):
+                opr = rec(n.oprand)
+                m = get_neg(opr) if n.op == UNARY_OP.NOT else UnaryNode(op=n.op, opr=opr)
+            elif isinstance(n, BinaryNode):
+                m = BinaryNode(op=n.op, opr1=rec(n.oprand1), opr2=rec(n.oprand2))
+            else:
+                m = n
+            r = _rewrite(m)
+            if r != m or m != n: # a new node, whose operands may simplify further
+                r = rec(r)
+            memo[n] = r
+        return r
+
+    return rec(n)
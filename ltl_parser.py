@@ -1,83 +1,176 @@
-# parser for LTL formula using antlr tree
+# parser for LTL formula
+# a hand-written recursive descent parser,
+# the antlr tree (see ltl_antlr.py) is only built on request
 
-from typing import FrozenSet, Set
-from antlr4 import *
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 
-from antlr.ltlParser import ltlParser
-from antlr.ltlLexer import ltlLexer
-from antlr.ltlVisitor import ltlVisitor
 from ltl_node import *
 from structure import StrMap
 
 
-class ASTBuilder(ltlVisitor):
-
-    def visitParFormula(self, ctx: ltlParser.ParFormulaContext) -> Node:
-        return self.visit(ctx.child)
-
-    def visitAp(self, ctx: ltlParser.ApContext) -> Node:
-        return APNode(ap=ctx.getText())
-
-    def visitUnaryExpr(self, ctx: ltlParser.UnaryExprContext) -> Node:
-        op = OP_DICT.get(ctx.op.text, None)
-        if isinstance(op, UNARY_OP):
-            if op == UNARY_OP.AWS: # G a === !(true U !a)
-                return get_neg(BinaryNode(
-                    op=BINARY_OP.UTL, 
-                    opr1=TRUE_NODE, 
-                    opr2=get_neg(self.visit(ctx.child))
-                ))
-            elif op == UNARY_OP.EVE: # F a === true U a
-                return BinaryNode(op=BINARY_OP.UTL, opr1=TRUE_NODE, opr2=self.visit(ctx.child))
-            elif op == UNARY_OP.NOT: # prevent !(!a)
-                return get_neg(self.visit(ctx.child))
-            else: # no transform for NXT
-                return UnaryNode(op=op, opr=self.visit(ctx.child))
-        else:
-            raise ValueError(f'Unexpected unary op: {ctx.op.text}')
-
-    def visitBinaryExpr(self, ctx: ltlParser.BinaryExprContext) -> Node:
-        op = OP_DICT.get(ctx.op.text)
-        if isinstance(op, BINARY_OP):
-            if op == BINARY_OP.OR: # a or b === !(!a and !b)
-                return get_neg(
-                    BinaryNode(op=BINARY_OP.AND, 
-                        opr1=get_neg(self.visit(ctx.lhs)),
-                        opr2=get_neg(self.visit(ctx.rhs))
-                    )
+def make_unary(op_str: str, child: Node) -> Node:
+    op = OP_DICT.get(op_str, None)
+    if isinstance(op, UNARY_OP):
+        if op == UNARY_OP.AWS: # G a === !(true U !a)
+            return get_neg(BinaryNode(
+                op=BINARY_OP.UTL, 
+                opr1=TRUE_NODE, 
+                opr2=get_neg(child)
+            ))
+        elif op == UNARY_OP.EVE: # F a === true U a
+            return BinaryNode(op=BINARY_OP.UTL, opr1=TRUE_NODE, opr2=child)
+        elif op == UNARY_OP.NOT: # prevent !(!a)
+            return get_neg(child)
+        else: # no transform for NXT
+            return UnaryNode(op=op, opr=child)
+    else:
+        raise ValueError(f'Unexpected unary op: {op_str}')
+
+
+def make_binary(op_str: str, lhs: Node, rhs: Node) -> Node:
+    op = OP_DICT.get(op_str)
+    if isinstance(op, BINARY_OP):
+        if op == BINARY_OP.OR: # a or b === !(!a and !b)
+            return get_neg(
+                BinaryNode(op=BINARY_OP.AND, 
+                    opr1=get_neg(lhs),
+                    opr2=get_neg(rhs)
                 )
-            elif op == BINARY_OP.IMP: # a -> b === !(a and !b)
-                return get_neg(BinaryNode(
-                    op=BINARY_OP.AND, 
-                    opr1=self.visit(ctx.lhs),
-                    opr2=get_neg(self.visit(ctx.rhs))
-                ))
-            else: # no transform for AND or UTL
-                return BinaryNode(op=op, opr1=self.visit(ctx.lhs), opr2=self.visit(ctx.rhs))
+            )
+        elif op == BINARY_OP.IMP: # a -> b === !(a and !b)
+            return get_neg(BinaryNode(
+                op=BINARY_OP.AND, 
+                opr1=lhs,
+                opr2=get_neg(rhs)
+            ))
+        else: # no transform for AND or UTL
+            return BinaryNode(op=op, opr1=lhs, opr2=rhs)
+    else:
+        raise ValueError(f'Unexpected binary op: {op_str}')
+
+
+class LTLSyntaxError(ValueError):
+    pass
+
+
+UNARY_OPS = {'!', 'F', 'G', 'X'}
+# binding strength of binary operators, all left-associative,
+# following the order of alternatives in antlr/ltl.g4
+BINARY_PREC = {'->': 4, '/\\': 3, '\\/': 2, 'U': 1}
+
+
+def tokenize(ltl: str) -> List[str]:
+    tokens = []
+    i = 0
+    while i < len(ltl):
+        c = ltl[i]
+        if c in ' \t\r\n':
+            i += 1
+        elif ltl[i:i + 2] in BINARY_PREC:
+            tokens.append(ltl[i:i + 2])
+            i += 2
+        elif c in '()' or c in UNARY_OPS or c == 'U' or c.isascii() and c.isalpha():
+            tokens.append(c)
+            i += 1
         else:
-            raise ValueError(f'Unexpected binary op: {ctx.op.text}')
+            raise LTLSyntaxError(f'Unexpected character {c!r} at {i}')
+    return tokens
+
+
+class Parser:
+    # recursive descent with precedence climbing,
+    # building the same AST as ASTBuilder on the antlr tree
+
+    def __init__(self, ltl: str) -> None:
+        self.tokens = tokenize(ltl)
+        self.pos = 0
+
+    def parse(self) -> Node:
+        n = self._formula(1)
+        if self.pos != len(self.tokens):
+            raise LTLSyntaxError(f'Unexpected token {self.tokens[self.pos]!r}')
+        return n
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _formula(self, min_prec: int) -> Node:
+        lhs = self._unary()
+        while True:
+            op = self._peek()
+            prec = BINARY_PREC.get(op, 0)
+            if prec < min_prec:
+                return lhs
+            self.pos += 1
+            rhs = self._formula(prec + 1)
+            lhs = make_binary(op, lhs, rhs)
+
+    def _unary(self) -> Node:
+        t = self._peek()
+        self.pos += 1
+        if t in UNARY_OPS:
+            return make_unary(t, self._unary())
+        if t == '(':
+            n = self._formula(1)
+            if self._peek() != ')':
+                raise LTLSyntaxError('Missing \')\'')
+            self.pos += 1
+            return n
+        if t is not None and t.isalpha() and t != 'U':
+            return APNode(ap=t)
+        if t is None:
+            raise LTLSyntaxError('Unexpected end of formula')
+        raise LTLSyntaxError(f'Unexpected token {t!r}')
+
+
+def parse(ltl: str, use_antlr: bool = False) -> Node:
+    if not use_antlr:
+        return Parser(ltl).parse()
+    from ltl_antlr import parse as parse_antlr
+    return parse_antlr(ltl)
+
+
+def __getattr__(name: str):
+    # ASTBuilder needs the antlr4 runtime, import it only when asked for
+    if name == 'ASTBuilder':
+        from ltl_antlr import ASTBuilder
+        return ASTBuilder
+    raise AttributeError(name)
         
 
 class AST:
     # The abstract syntax tree of the given LTL formula
 
-    def __init__(self, ltl: str) -> None:
-        self.root: Node = None
+    def __init__(self, ltl: str = None, use_antlr: bool = False, root: Optional[Node] = None,
+                 simplify: bool = False) -> None:
+        # either parse ltl, or take an already parsed root
+        # with simplify, the formula is rewritten (see ltl_node.simplify) before the closure is built
+        self.root: Node = root
         self.closure: FrozenSet[Node] = None
+        self.elementary: Optional[List[int]] = None
         self.contains_true: bool = False
         self.AP = StrMap()
-        self._build(ltl)
-
-    def _build(self, ltl: str) -> None:
-        input_stream = InputStream(ltl)
-        lexer = ltlLexer(input_stream)
-        tokens = CommonTokenStream(lexer)
-        parser = ltlParser(tokens)
-        tree = parser.formula()
-        self.root = ASTBuilder().visit(tree)
+        # the closure indexed once, an elementary set is then a bitmask
+        # whose i-th bit is set iff nodes[i] is in the set
+        self.nodes: List[Node] = []
+        self.index: Dict[Node, int] = {}
+        self.pairs: List[int] = [] # masks of {A, !A}
+        self.true_mask: int = 0
+        self.and_rules: List[Tuple[int, int]] = [] # (a /\ b, a | b)
+        self.until_rules: List[Tuple[int, int, int]] = [] # (a U b, a, b)
+        self.next_rules: List[Tuple[int, int]] = [] # (X a, a)
+        self.ap_bits: List[Tuple[int, int]] = [] # (a, id of a)
+        self._build(ltl, use_antlr, simplify)
+
+    def _build(self, ltl: str, use_antlr: bool, rewrite: bool) -> None:
+        if self.root is None:
+            self.root = parse(ltl, use_antlr)
+        if rewrite:
+            self.root = simplify(self.root)
         self._set_ap(self.root)
         self.closure = self.get_closure()
         self.contains_true = (TRUE_NODE in self.closure)
+        self._index_closure()
 
     def _set_ap(self, cur_node: Node) -> None:
         assert cur_node is not None
@@ -141,7 +234,7 @@ class AST:
                     return False
         l = list(sub)
         for i in range(len(l)):
-            for j in range(i + 1, len(l)):
+            for j in range(i, len(l)): # a /\ a is in the closure as well
                 b = BinaryNode(op=BINARY_OP.AND, opr1=l[i], opr2=l[j])
                 if b in self.closure and b not in sub:
                     return False
@@ -160,35 +253,96 @@ class AST:
         # the generation has guaranteed maximality
         return self._check_consistency(sub) and self._check_local_consistency(sub)
 
-    def get_elementary_sets(self) -> List[FrozenSet[Node]]:
-        pos = []
-        neg = []
-        vis = set()
+    def _index_closure(self) -> None:
+        self.nodes = list(self.closure)
+        self.index = {n: i for i, n in enumerate(self.nodes)}
+        bit = lambda n: 1 << self.index[n]
+        vis = 0
         # one and only one of A and !A is in the elementary set
         # due to maximality
-        # first devide all elements in the closure into two sets
-        for s in self.closure:
-            if s in vis:
-                assert get_neg(s) in vis
+        for n in self.nodes:
+            if vis & bit(n):
                 continue
-            pos.append(s)
-            neg.append(get_neg(s))
-            vis.add(s)
-            vis.add(get_neg(s))
+            self.pairs.append(bit(n) | bit(get_neg(n)))
+            vis |= self.pairs[-1]
+        if self.contains_true:
+            self.true_mask = bit(TRUE_NODE)
+        for n in self.nodes:
+            if isinstance(n, BinaryNode) and n.op == BINARY_OP.AND:
+                self.and_rules.append((bit(n), bit(n.oprand1) | bit(n.oprand2)))
+            elif isinstance(n, BinaryNode) and n.op == BINARY_OP.UTL:
+                self.until_rules.append((bit(n), bit(n.oprand1), bit(n.oprand2)))
+            elif isinstance(n, UnaryNode) and n.op == UNARY_OP.NXT:
+                self.next_rules.append((bit(n), bit(n.oprand)))
+            elif isinstance(n, APNode):
+                self.ap_bits.append((bit(n), self.AP.str_to_id[n.ap]))
 
+    def to_set(self, b: int) -> FrozenSet[Node]:
+        return frozenset(n for i, n in enumerate(self.nodes) if b & (1 << i))
+
+    def to_mask(self, sub: Set[Node]) -> int:
+        b = 0
+        for n in sub:
+            b |= 1 << self.index[n]
+        return b
+
+    def get_label(self, b: int) -> Tuple[int, ...]:
+        # the APs in an elementary set
+        return tuple(sorted(i for (a, i) in self.ap_bits if b & a))
+
+    def is_elementary_mask(self, b: int) -> bool:
+        # the generation has guaranteed maximality
+        if self.true_mask and not b & self.true_mask:
+            return False
+        for n, ab in self.and_rules:
+            if bool(b & n) != (b & ab == ab):
+                return False
+        for n, p1, p2 in self.until_rules:
+            if b & p2 and not b & n:
+                return False
+            if b & n and not b & (p1 | p2):
+                return False
+        return True
+
+    def get_elementary_masks(self) -> List[int]:
+        # enumerate for 2 ** (size(closure) / 2) possibilities in Gray code order,
+        # so that each candidate differs from the previous one in a single pair
+        if self.elementary is not None:
+            return self.elementary
+        b = 0
+        for p in self.pairs:
+            b |= p & -p # the lowest bit of each pair
         ret = []
-        for i in range(1 << len(pos)): 
-            # enumerate for 2 ** (size(closure) / 2) possibilities
-            sub = set()
-            for j in range(len(pos)):
-                if i & (1 << j):
-                    sub.add(pos[j])
-                else:
-                    sub.add(neg[j])
-            if self.is_elementary(sub):
-                ret.append(frozenset(sub))
+        for i in range(1 << len(self.pairs)):
+            if i:
+                j = (i & -i).bit_length() - 1
+                b ^= self.pairs[j]
+            if self.is_elementary_mask(b):
+                ret.append(b)
+        self.elementary = ret
         return ret
 
+    def get_elementary_sets(self) -> List[FrozenSet[Node]]:
+        return [self.to_set(b) for b in self.get_elementary_masks()]
+
+    def get_successor_mask(self, b: int) -> Optional[Tuple[int, int]]:
+        # bb is a successor of b iff bb & care == req,
+        # return None if b has no successor at all
+        xcare = xreq = 0
+        for n, p in self.next_rules:
+            xcare |= p
+            if b & n:
+                xreq |= p
+        ucare = ureq = 0
+        for n, p1, p2 in self.until_rules:
+            # if p2 in b, or p1 not in b, then local consistency already decides
+            if not b & p2 and b & p1:
+                ucare |= n
+                ureq |= b & n
+        if (xreq ^ ureq) & xcare & ucare:
+            return None
+        return xcare | ucare, xreq | ureq
+
     def check_next(self, b: Set[Node], bb: Set[Node]) -> bool:
         for n in self.closure:
             if isinstance(n, UnaryNode) and n.op == UNARY_OP.NXT:
@@ -1,39 +1,318 @@
 import argparse
+import multiprocessing
+import signal
+import sys
+import time
+import weakref
+import tracemalloc
+from typing import Dict, List, Optional, Set, Tuple, Union
 
-from dfs import check
-from ltl_parser import AST
-from reader import read_BM, read_TS, write_ans
-from transform import AST_to_GNBA, GNBA_to_NBA, NBA_product_TS, partial_ts
+from cache import AutomatonCache
+from dfs import bad_states, check, check_scc, nested_dfs
+from ltl_node import get_neg
+from ltl_parser import AST, parse
+from por import ActionAnalysis, ReducedProduct, is_stutter_invariant, relevant_aps
+from profiler import Profile, stage
+from reader import DEFAULT_BM_FILE, DEFAULT_TS_FILE, file_digest, read_BM, read_model, read_TS
+from reduction import reduce_automaton
+from results import ResultSink
+from structure import CompactTS, GNBA, ImplicitTS, NBA, TS, StrMap
+from symbolic import SymbolicTS, check_symbolic
+from tableau import AST_to_GNBA_tableau
+from transform import AST_to_GNBA, GNBA_to_NBA, LazyProduct, NBA_product_TS, partial_ts
 
 
-if __name__ == '__main__':
+automata = AutomatonCache() # translated automata, shared by all formulae
+symbolic_models: 'weakref.WeakKeyDictionary[Union[TS[int], CompactTS], SymbolicTS]' = weakref.WeakKeyDictionary()
+action_analyses: 'weakref.WeakKeyDictionary[Union[TS[int], CompactTS], ActionAnalysis]' = weakref.WeakKeyDictionary()
+
+
+def num_edges(aut: Union[GNBA, NBA]) -> int:
+    return sum(len(qq) for qq in aut.trans.values())
+
+
+def negated_ast(ltl: str, args: argparse.Namespace) -> AST:
+    # the AST of !(ltl), parsed without the wrapper so that syntax errors point into ltl
+    return AST(root=get_neg(parse(ltl, args.antlr)), simplify=args.simplify)
+
+
+def translate(ltl: str, args: argparse.Namespace, generalized: bool = False,
+              verbose: int = 0, prof: Optional[Profile] = None) -> Tuple[AST, Union[GNBA, NBA]]:
+    # the automaton accepting the paths violating ltl
+    # verbose >= 1 prints the automata
+    with stage(prof, 'ast'): # parse and closure
+        ast = negated_ast(ltl, args)
+    method = 'tableau' if args.tableau else 'elementary'
+    if args.reduce:
+        method += '/reduced'
+    key = automata.key(ast, f'{method}/gnba')
+    with stage(prof, 'gnba'):
+        gnba = automata.get(key)
+        if gnba is None:
+            if args.tableau:
+                gnba = AST_to_GNBA_tableau(ast)
+            else:
+                gnba = AST_to_GNBA(ast)
+            if args.reduce:
+                gnba = reduce_automaton(gnba)
+            automata.put(key, gnba)
+        elif prof is not None:
+            prof.count('gnba_cached', 1)
+    if prof is not None:
+        prof.count('closure', len(ast.closure))
+        if ast.elementary is not None:
+            prof.count('elementary', len(ast.elementary))
+        prof.count('gnba_states', gnba.num_states)
+        prof.count('gnba_edges', num_edges(gnba))
+        prof.count('gnba_sets', len(gnba.F))
+    if verbose >= 1:
+        gnba.print()
+    if generalized:
+        return ast, gnba
+    key = automata.key(ast, f'{method}/nba')
+    with stage(prof, 'nba'):
+        nba = automata.get(key)
+        if nba is None:
+            nba = GNBA_to_NBA(gnba)
+            if args.reduce:
+                nba = reduce_automaton(nba)
+            automata.put(key, nba)
+        elif prof is not None:
+            prof.count('nba_cached', 1)
+    if prof is not None:
+        prof.count('nba_states', nba.num_states)
+        prof.count('nba_edges', num_edges(nba))
+    if verbose >= 1:
+        nba.print()
+    return ast, nba
+
+
+def product(aut: Union[GNBA, NBA], ts_: Union[TS[int], CompactTS, ImplicitTS], args: argparse.Namespace,
+            verbose: int = 0, prof: Optional[Profile] = None) -> Union[TS, LazyProduct]:
+    # verbose >= 2 prints the edges of the product
+    with stage(prof, 'product'):
+        if args.lazy or isinstance(ts_, ImplicitTS):
+            return LazyProduct(aut, ts_) # explored by the emptiness check
+        prod = NBA_product_TS(aut, ts_)
+    if prof is not None:
+        states = set(prod.I)
+        for (s, _, t) in prod.trans:
+            states.add(s)
+            states.add(t)
+        prof.count('product_states', len(states))
+        prof.count('product_edges', len(prod.trans))
+    if verbose >= 2:
+        for (s, a), t in prod.trans_map.items():
+            print(f'{s} --- {a} --> {t}')
+    return prod
+
+
+def check_ltl(ts: Union[TS[int], CompactTS, ImplicitTS], ap: StrMap, ltl: str, args: argparse.Namespace,
+              init: Optional[int] = None, verbose: int = 0, prof: Optional[Profile] = None) -> int:
+    # 1 if every path of ts (from init, if given) satisfies ltl, 0 otherwise
+    # generalized acceptance is checked directly by the SCC engine, no NBA needed
+    ast, aut = translate(ltl, args, generalized=(args.engine == 'scc'), verbose=verbose, prof=prof)
+    stats = prof.counters if prof is not None else None
+    if args.engine == 'bdd':
+        # the TS is encoded once, the formula only renames its APs
+        with stage(prof, 'encode'):
+            if ts not in symbolic_models:
+                symbolic_models[ts] = SymbolicTS(ts, ap)
+        with stage(prof, 'emptiness'):
+            return int(check_symbolic(aut, symbolic_models[ts], ast.AP, [init] if init is not None else None, stats))
+    ts_ = partial_ts(ts, ast, ap)
+    if init is not None:
+        ts_.I = [init]
+    if args.por and args.engine == 'ndfs' and not isinstance(ts, ImplicitTS) and is_stutter_invariant(ast):
+        # the actions are analysed once, the formula only picks the invisible ones
+        with stage(prof, 'product'):
+            if ts not in action_analyses:
+                action_analyses[ts] = ActionAnalysis(ts)
+            prod = ReducedProduct(aut, ts_, action_analyses[ts], relevant_aps(ast, ap))
+        with stage(prof, 'emptiness'):
+            acc = int(nested_dfs(prod, aut, stats))
+        if prof is not None:
+            prof.count('por_reduced', len(prod.choice))
+        return acc
+    prod = product(aut, ts_, args, verbose, prof)
+    with stage(prof, 'emptiness'):
+        if args.engine == 'scc':
+            return int(check_scc(prod, aut, stats))
+        if args.engine == 'textbook':
+            return int(check(prod, aut, stats))
+        return int(nested_dfs(prod, aut, stats))
+
+
+def violating_states(ts: Union[TS[int], CompactTS], ap: StrMap, ltl: str,
+                     args: argparse.Namespace, prof: Optional[Profile] = None) -> Set[int]:
+    # all states of ts with some path violating ltl, in one pass over the product
+    ast, gnba = translate(ltl, args, generalized=True, verbose=args.verbose, prof=prof)
+    ts_ = partial_ts(ts, ast, ap)
+    ts_.I = list(range(ts.num_states))
+    prod = product(gnba, ts_, args, args.verbose, prof)
+    with stage(prof, 'emptiness'):
+        bad = bad_states(prod, gnba, prof.counters if prof is not None else None)
+        return {s for (s, q) in prod.I if (s, q) in bad}
+
+
+def run_check(ts: Union[TS[int], CompactTS], ap: StrMap, ltl: str, args: argparse.Namespace,
+              init: Optional[int] = None) -> int:
+    # check_ltl, with its profile emitted if asked for
+    prof = Profile() if args.profile else None
+    acc = check_ltl(ts, ap, ltl, args, init=init, verbose=args.verbose, prof=prof)
+    if prof is not None:
+        prof.emit(args.profile, formula=ltl, state=init, result=acc)
+    return acc
+
+
+def run_global(ts: Union[TS[int], CompactTS], ap: StrMap, ltl: str,
+               args: argparse.Namespace) -> Set[int]:
+    # violating_states, with its profile emitted if asked for
+    prof = Profile() if args.profile else None
+    bad = violating_states(ts, ap, ltl, args, prof)
+    if prof is not None:
+        prof.emit(args.profile, formula=ltl, violating=len(bad))
+    return bad
+
+
+def benchmark_entries(ltl_all: List[str],
+                      ltl_state: List[Tuple[int, str]]) -> List[Tuple[str, Optional[int]]]:
+    # (formula, state) in the order of the answers, no state for the initial states
+    return [(ltl, None) for ltl in ltl_all] + [(ltl, s) for (s, ltl) in ltl_state]
+
+
+def run_serial(ts: Union[TS[int], CompactTS], ap: StrMap, entries: List[Tuple[str, Optional[int]]],
+               args: argparse.Namespace, sink: ResultSink) -> None:
+    # the time of a global query is that of the analysis answering all queries of its formula
+    violating: Dict[str, Tuple[Set[int], float]] = {}
+    for (ltl, s) in entries:
+        t = time.perf_counter()
+        if s is not None and args.all_states:
+            if ltl not in violating:
+                bad = run_global(ts, ap, ltl, args)
+                violating[ltl] = (bad, time.perf_counter() - t)
+            bad, elapsed = violating[ltl]
+            acc = int(s not in bad)
+        else:
+            acc = run_check(ts, ap, ltl, args, init=s)
+            elapsed = time.perf_counter() - t
+        sink.write(acc, ltl, s, elapsed)
+
+
+# the TS and the arguments of the workers, inherited through fork
+_worker_state: Optional[Tuple[Union[TS[int], CompactTS], StrMap, argparse.Namespace]] = None
+
+
+def _run_task(task: Tuple[int, str, str, Optional[int]]) -> Tuple[int, Union[int, Set[int]], float]:
+    i, kind, ltl, init = task
+    ts, ap, args = _worker_state
+    t = time.perf_counter()
+    if kind == 'global':
+        r = run_global(ts, ap, ltl, args)
+    else:
+        r = run_check(ts, ap, ltl, args, init=init)
+    return i, r, time.perf_counter() - t
+
+
+def run_parallel(ts: Union[TS[int], CompactTS], ap: StrMap, entries: List[Tuple[str, Optional[int]]],
+                 args: argparse.Namespace, sink: ResultSink) -> None:
+    # check the formulae in a pool of forked processes sharing the TS read by the parent,
+    # the answers are still written in input order
+    global _worker_state
+    tasks: List[Tuple[str, str, Optional[int]]] = []
+    answers: List[Tuple[int, Optional[int]]] = [] # (task, state of a global query)
+    task_of: Dict[str, int] = {}
+    for (ltl, s) in entries:
+        if s is not None and args.all_states:
+            if ltl not in task_of:
+                task_of[ltl] = len(tasks)
+                tasks.append(('global', ltl, None))
+            answers.append((task_of[ltl], s))
+        else:
+            answers.append((len(tasks), None))
+            tasks.append(('check', ltl, s))
+    # the largest formulae first, so that they do not finish last
+    # the closure of each distinct formula is built once
+    size = {ltl: len(negated_ast(ltl, args).closure)
+            for ltl in dict.fromkeys(ltl for (_, ltl, _) in tasks)}
+    order = sorted(range(len(tasks)), key=lambda i: -size[tasks[i][1]])
+
+    _worker_state = (ts, ap, args)
+    results: Dict[int, Tuple[Union[int, Set[int]], float]] = {}
+    k = 0
+    with multiprocessing.get_context('fork').Pool(args.jobs) as pool:
+        for i, r, elapsed in pool.imap_unordered(_run_task, [(i,) + tasks[i] for i in order]):
+            results[i] = (r, elapsed)
+            while k < len(answers) and answers[k][0] in results:
+                i, s = answers[k]
+                r, elapsed = results[i]
+                sink.write(r if s is None else int(s not in r), entries[k][0], entries[k][1], elapsed)
+                k += 1
+
+
+def make_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument('-ts', type=str, default=None)
     parser.add_argument('-bm', '--benchmark', type=str, default=None)
+    parser.add_argument('--model', type=str, default=None, metavar='MODULE[:FUNCTION]',
+                        help='check the ImplicitTS returned by FUNCTION() (default: model()) of MODULE instead of reading -ts')
+    parser.add_argument('--lazy', action='store_true', help='explore the product on the fly')
+    parser.add_argument('--antlr', action='store_true', help='parse formulae with the antlr grammar')
+    parser.add_argument('--simplify', action='store_true', help='rewrite formulae to smaller equivalent ones first')
+    parser.add_argument('--tableau', action='store_true', help='translate LTL to GNBA by tableau expansion')
+    parser.add_argument('--compact', action='store_true', help='store the TS in compact arrays')
+    parser.add_argument('--cache', action='store_true', help='reuse a binary snapshot of the TS file (implies --compact)')
+    parser.add_argument('--reduce', action='store_true',
+                        help='prune and quotient the GNBA and the NBA by direct simulation')
+    parser.add_argument('--engine', choices=['ndfs', 'textbook', 'scc', 'bdd'], default='ndfs',
+                        help='emptiness check: linear or textbook nested DFS on the NBA, SCC-based on the GNBA, '
+                             'or symbolic with BDDs on the NBA')
+    parser.add_argument('--por', action='store_true',
+                        help='partial-order reduction of the on-the-fly product for X-free formulae (ndfs engine only)')
+    parser.add_argument('--global', dest='all_states', action='store_true',
+                        help='answer all state queries of a formula by one global analysis')
+    parser.add_argument('--automaton-cache', type=str, default=None, metavar='DIR',
+                        help='also keep translated automata in DIR between runs')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--profile', type=str, nargs='?', const='-', default=None, metavar='FILE',
+                        help='write time, memory and counters of each stage as JSON lines to FILE (default: stderr)')
+    parser.add_argument('-o', '--output', type=str, default=None, help='append the answers to OUTPUT (default: answer.txt)')
+    parser.add_argument('--jsonl', type=str, default=None, metavar='FILE',
+                        help='also append formula, state, answer and time of each entry as JSON lines to FILE')
+    parser.add_argument('--resume', action='store_true',
+                        help='keep a checkpoint next to the output and skip the entries answered by an interrupted run')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='print the automata (-v) and the product (-vv)')
+    return parser
+
+
+if __name__ == '__main__':
+    parser = make_parser()
     args = parser.parse_args()
+    if args.model and (args.engine == 'bdd' or args.all_states):
+        parser.error('--engine bdd and --global need the states of the TS up front, which --model does not give')
+    automata.path = args.automaton_cache
+    if args.profile:
+        if args.profile != '-':
+            open(args.profile, 'w').close()
+        tracemalloc.start()
 
-    ts, ap = read_TS(args.ts)
+    if args.model:
+        ts, ap = read_model(args.model)
+    else:
+        ts, ap = read_TS(args.ts, compact=args.compact, cache=args.cache)
     ltl_all, ltl_state = read_BM(args.benchmark)
-    
-    for ltl in ltl_all:
-        ast = AST(f'!({ltl})')
-        ts_ = partial_ts(ts, ast, ap)
-        gnba = AST_to_GNBA(ast)
-        gnba.print()
-        nba = GNBA_to_NBA(gnba)
-        nba.print()
-        prod = NBA_product_TS(nba, ts_)
-        for (s, a), t in prod.trans_map.items():
-            print(f'{s} --- {a} --> {t}')
-        acc = check(prod, nba)
-        write_ans(int(acc))
-
-    for (s, ltl) in ltl_state:
-        ast = AST(f'!({ltl})')
-        ts_ = partial_ts(ts, ast, ap)
-        ts_.I = [s]
-        gnba = AST_to_GNBA(ast)
-        nba = GNBA_to_NBA(gnba)
-        prod = NBA_product_TS(nba, ts_)
-        acc = check(prod, nba)
-        write_ans(int(acc))
+    entries = benchmark_entries(ltl_all, ltl_state)
+
+    key = {}
+    if args.resume:
+        # a checkpoint only applies to the same inputs
+        key = {'ts': args.model if args.model else file_digest(args.ts or DEFAULT_TS_FILE),
+               'benchmark': file_digest(args.benchmark or DEFAULT_BM_FILE)}
+        # on preemption, leave through the sink so that the answers so far are kept
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    with ResultSink(args.output, args.jsonl, args.resume, key) as sink:
+        if args.jobs > 1:
+            run_parallel(ts, ap, entries[sink.done:], args, sink)
+        else:
+            run_serial(ts, ap, entries[sink.done:], args, sink)
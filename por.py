@@ -0,0 +1,110 @@
+# partial-order reduction of the lazy product for stutter-invariant (X-free) formulae
+# from a state s, the blue search of nested_dfs may follow a single action a (the ample set)
+# instead of all actions enabled at s, if
+# C0 a is enabled at s, and the automaton can follow it: an ample set without product successors
+#    would end the search where the full product goes on
+# C1 a is independent of every other action, so no other action can disable it or fail to commute with it
+# C2 a is invisible: it never changes the APs of the formula
+# C3 (cycle proviso) no successor by a is on the stack of the blue search
+# the red search must see the same reduced graph, so the choice of the blue search is recorded
+
+from typing import Callable, Dict, Hashable, List, Set, Tuple, TypeVar, Union
+
+from ltl_node import UNARY_OP, UnaryNode
+from ltl_parser import AST
+from structure import CompactTS, GNBA, NBA, StrMap, TS
+from transform import LazyProduct
+
+
+T = TypeVar('T', bound=Hashable)
+
+
+class ActionAnalysis:
+    # independence and visibility of the actions of an explicit TS, shared by all formulae
+    # actions a and b are independent if wherever both are enabled, both are deterministic,
+    # each stays enabled after the other, and they commute
+
+    def __init__(self, ts: Union[TS[int], CompactTS]) -> None:
+        succ: Dict[int, Dict[int, Dict[int, None]]] = {} # s -> a -> distinct targets
+        for (s, a, t) in ts.iter_trans():
+            succ.setdefault(s, {}).setdefault(a, {})[t] = None
+        self.succ: Dict[int, Dict[int, List[int]]] = {
+            s: {a: list(targets) for a, targets in by_action.items()} for s, by_action in succ.items()}
+        del succ
+        num_actions = max(ts.action_set.num_str, 1)
+        self.changed = [0] * num_actions # AP bits some transition by the action changes
+        dependent: Set[int] = set() # actions dependent on some other action
+        nondet: Set[int] = set()
+        for s, by_action in self.succ.items():
+            l = ts.label(s)
+            acts = list(by_action)
+            for a in acts:
+                if len(by_action[a]) > 1:
+                    nondet.add(a)
+                for t in by_action[a]:
+                    self.changed[a] |= l ^ ts.label(t)
+            for i, a in enumerate(acts):
+                for b in acts[i + 1:]:
+                    if not self._commute(by_action, a, b):
+                        dependent.add(a)
+                        dependent.add(b)
+        # the actions that may form an ample set alone
+        self.safe = [a not in dependent and a not in nondet for a in range(num_actions)]
+
+    def _commute(self, by_action: Dict[int, List[int]], a: int, b: int) -> bool:
+        if len(by_action[a]) != 1 or len(by_action[b]) != 1:
+            return False
+        ba = self.succ.get(by_action[a][0], {}).get(b, None)
+        ab = self.succ.get(by_action[b][0], {}).get(a, None)
+        return ba is not None and ab is not None and len(ba) == 1 and len(ab) == 1 and ba[0] == ab[0]
+
+    def invisible(self, relevant: int) -> List[bool]:
+        # relevant is the bitmask of the APs of the formula, over the AP ids of the TS
+        return [not (c & relevant) for c in self.changed]
+
+
+def is_stutter_invariant(ast: AST) -> bool:
+    # X-free formulae are stutter-invariant
+    return not any(isinstance(n, UnaryNode) and n.op == UNARY_OP.NXT for n in ast.closure)
+
+
+def relevant_aps(ast: AST, ap: StrMap) -> int:
+    # the APs of the formula, over the AP ids of the TS
+    return sum(1 << i for i in range(ap.num_str) if ap.id_to_str[i] in ast.AP.str_to_id)
+
+
+class ReducedProduct(LazyProduct[T]):
+    # the lazy product, explored through ample sets by nested_dfs
+
+    def __init__(self, nba: Union[NBA, GNBA], ts: Union[TS[int], CompactTS],
+                 analysis: ActionAnalysis, relevant: int) -> None:
+        super().__init__(nba, ts)
+        self.analysis = analysis
+        invisible = analysis.invisible(relevant)
+        self.candidate = [safe and inv for safe, inv in zip(analysis.safe, invisible)]
+        self.choice: Dict[Tuple[int, int], int] = {} # product state -> its ample action, if reduced
+
+    def _by_action(self, x: Tuple[int, int], a: int) -> List[Tuple[int, int]]:
+        q = self.id_map[x[1]]
+        t = self.analysis.succ[x[0]][a][0]
+        return [(t, self.nba.state_map[p]) for p in self.nba.match(q, self.ts.label(t))]
+
+    def ample(self, x: Tuple[int, int], on_stack: Callable[[Tuple[int, int]], bool]) -> List[Tuple[int, int]]:
+        # the successors of x for the blue search, the first action meeting C0 - C3,
+        # or all successors if there is none
+        by_action = self.analysis.succ.get(x[0], None)
+        if by_action is not None and len(by_action) > 1:
+            for a in by_action:
+                if self.candidate[a]:
+                    P = self._by_action(x, a)
+                    if P and not any(on_stack(y) for y in P):
+                        self.choice[x] = a
+                        return P
+        return super().post(x)
+
+    def post(self, x: Tuple[int, int]) -> List[Tuple[int, int]]:
+        # the successors chosen by the blue search
+        a = self.choice.get(x, None)
+        if a is None:
+            return super().post(x)
+        return self._by_action(x, a)
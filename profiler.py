@@ -0,0 +1,52 @@
+# wall time, peak memory and counters of the pipeline stages of one formula
+
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, Optional
+
+
+class Profile:
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, Dict[str, float]] = {} # stage -> time (s) and peak memory (bytes)
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        # peak memory is only known if tracemalloc is tracing,
+        # it is measured above the memory in use when the stage starts
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = self.stages.setdefault(name, {'time': 0.0})
+            record['time'] += time.perf_counter() - t
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                record['peak'] = max(record.get('peak', 0), peak)
+
+    def count(self, name: str, value: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def emit(self, file: str, **info: Any) -> None:
+        # one JSON line, '-' for stderr
+        # each line is written at once, so that processes can share the file
+        line = json.dumps({**info, 'stages': self.stages, 'counters': self.counters}) + '\n'
+        if file == '-':
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            with open(file, 'a') as f:
+                f.write(line)
+
+
+def stage(prof: Optional[Profile], name: str) -> ContextManager[None]:
+    # time a stage if profiling, do nothing otherwise
+    return prof.stage(name) if prof is not None else nullcontext()
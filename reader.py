@@ -1,6 +1,13 @@
 # parse from file
 
-from typing import Any, List
+import hashlib
+import importlib
+import json
+import mmap
+import os
+from array import array
+from itertools import chain, islice
+from typing import Any, List, Optional, TextIO
 
 from structure import *
 
@@ -8,16 +15,24 @@ from structure import *
 DEFAULT_TS_FILE = 'TS.txt'
 DEFAULT_BM_FILE = 'benchmark.txt'
 DEFAULT_OUTPUT = 'answer.txt'
+CACHE_SUFFIX = '.tsc' # binary snapshot of a TS file
+CACHE_MAGIC = b'CTS\0'
+CACHE_VERSION = 1
+BULK_CHUNK = 1 << 22 # bytes of lines converted at a time
 
 
 def read_int(s: str) -> List[int]:
     return list(map(int, s.strip().split(' ')))
 
 
-def read_TS(file: str = None) -> Tuple[TS[int], StrMap]:
+def read_TS(file: str = None, compact: bool = False, cache: bool = False,
+            log: Optional[TextIO] = None) -> Tuple[Union[TS[int], CompactTS], StrMap]:
+    # log: where to report the file read, stdout by default
     if file is None:
         file = DEFAULT_TS_FILE
-    print(f"TS input file: {file}")
+    print(f"TS input file: {file}", file=log)
+    if compact or cache:
+        return read_TS_bulk(file, cache)
     ts = TS[int]()
     apset = StrMap() 
     with open(file, 'r') as f:
@@ -44,7 +59,170 @@ def read_TS(file: str = None) -> Tuple[TS[int], StrMap]:
             else:
                 ts.AP[i] = set(aps)
     return ts, apset
-        
+
+
+def read_TS_bulk(file: str, cache: bool = False) -> Tuple[CompactTS, StrMap]:
+    # read the file a chunk of lines at a time and convert it straight into arrays
+    # if cache, reuse (or write) a binary snapshot next to the file
+    if cache:
+        loaded = load_TS_cache(file)
+        if loaded is not None:
+            return loaded
+    with open(file, 'r') as f:
+        S, T = read_int(f.readline())
+        line = f.readline()
+        I = read_int(line) if line.strip() else []
+        actset = StrMap()
+        for a in f.readline().strip().split(' '):
+            actset.add(a)
+        apset = StrMap()
+        for ap in f.readline().strip().split(' '):
+            apset.add(ap)
+        # read transitions
+        src, act, dst = array('i'), array('i'), array('i')
+        rest: List[str] = [] # lines of the last chunk past the transitions
+        while len(src) < T:
+            chunk = f.readlines(BULK_CHUNK)
+            assert chunk
+            chunk, rest = chunk[:T - len(src)], chunk[T - len(src):]
+            tokens = ' '.join(chunk).split()
+            assert len(tokens) == 3 * len(chunk)
+            src.extend(map(int, tokens[0::3]))
+            act.extend(map(actset.str_to_id.__getitem__, tokens[1::3]))
+            dst.extend(map(int, tokens[2::3]))
+        # read AP of states, most states share a few labels
+        memo: Dict[str, int] = {}
+        labels: List[int] = []
+        for l in islice(chain(rest, f), S):
+            m = memo.get(l, None)
+            if m is None:
+                aps = read_int(l)
+                if aps[0] == -1:
+                    assert len(aps) == 1
+                    aps = []
+                m = memo[l] = set_to_mask(aps)
+            labels.append(m)
+    ts = CompactTS.from_edges(S, src, act, dst, make_labels(labels, apset.num_str))
+    ts.action_set = actset
+    ts.I = I
+    if cache:
+        write_TS_cache(file, ts, apset)
+    return ts, apset
+
+
+def _cache_file(file: str) -> str:
+    return file + CACHE_SUFFIX
+
+
+def file_digest(file: str) -> str:
+    h = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_TS_cache(file: str, ts: CompactTS, apset: StrMap) -> None:
+    # layout: magic, header length, JSON header, then the arrays, 8-byte aligned
+    st = os.stat(file)
+    arrays = [('offsets', ts.offsets), ('targets', ts.targets), ('actions', ts.actions), ('labels', ts.labels)]
+    if not all(isinstance(a, array) for _, a in arrays):
+        return # e.g. more than 64 APs, labels do not fit into words
+    header = {
+        'version': CACHE_VERSION,
+        'size': st.st_size,
+        'mtime': st.st_mtime_ns,
+        'sha1': file_digest(file),
+        'num_states': ts.num_states,
+        'I': list(ts.I),
+        'actions': [ts.action_set.id_to_str[i] for i in range(ts.action_set.num_str)],
+        'AP': [apset.id_to_str[i] for i in range(apset.num_str)],
+        'arrays': [],
+    }
+    offset = 0
+    for name, a in arrays:
+        header['arrays'].append((name, a.typecode, offset, len(a)))
+        offset += (len(a) * a.itemsize + 7) // 8 * 8
+    head = json.dumps(header).encode()
+    start = (len(CACHE_MAGIC) + 8 + len(head) + 7) // 8 * 8
+    tmp = _cache_file(file) + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(CACHE_MAGIC)
+        f.write(len(head).to_bytes(8, 'little'))
+        f.write(head)
+        for name, a in arrays:
+            f.write(b'\0' * (start - f.tell()))
+            f.write(a.tobytes())
+            start += (len(a) * a.itemsize + 7) // 8 * 8
+    os.replace(tmp, _cache_file(file))
+
+
+def load_TS_cache(file: str) -> Optional[Tuple[CompactTS, StrMap]]:
+    # map the snapshot into memory, the arrays are views of the mapped file
+    # return None if there is no valid snapshot, a damaged one counts as none
+    cfile = _cache_file(file)
+    if not os.path.exists(cfile):
+        return None
+    with open(cfile, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # empty file
+            return None
+    try:
+        loaded = _map_TS_cache(file, cfile, mm)
+    except (KeyError, TypeError, ValueError): # truncated or malformed header
+        loaded = None
+    if loaded is None:
+        mm.close()
+    return loaded
+
+
+def _map_TS_cache(file: str, cfile: str, mm: mmap.mmap) -> Optional[Tuple[CompactTS, StrMap]]:
+    if mm[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+        return None
+    n = int.from_bytes(mm[len(CACHE_MAGIC):len(CACHE_MAGIC) + 8], 'little')
+    pos = len(CACHE_MAGIC) + 8
+    header = json.loads(mm[pos:pos + n])
+    if header['version'] != CACHE_VERSION:
+        return None
+    st = os.stat(file)
+    if (header['size'], header['mtime']) != (st.st_size, st.st_mtime_ns):
+        # touched, but possibly not changed
+        if header['size'] != st.st_size or header['sha1'] != file_digest(file):
+            return None
+        # same content, record the new mtime in place so that later runs skip the hash
+        header['mtime'] = st.st_mtime_ns
+        head = json.dumps(header).encode()
+        if len(head) <= n:
+            with open(cfile, 'r+b') as f:
+                f.seek(pos)
+                f.write(head.ljust(n)) # json allows the trailing spaces
+    start = (pos + n + 7) // 8 * 8
+    bounds = {name: (code, start + offset, start + offset + length * array(code).itemsize)
+              for name, code, offset, length in header['arrays']}
+    if any(e > len(mm) for _, _, e in bounds.values()):
+        return None # truncated arrays
+    view = memoryview(mm)
+    arrays = {name: view[b:e].cast(code) for name, (code, b, e) in bounds.items()}
+    ts = CompactTS(header['num_states'], arrays['offsets'], arrays['targets'], arrays['labels'], arrays['actions'])
+    for a in header['actions']:
+        ts.action_set.add(a)
+    ts.I = header['I']
+    apset = StrMap()
+    for ap in header['AP']:
+        apset.add(ap)
+    return ts, apset
+
+
+def read_model(spec: str, log: Optional[TextIO] = None) -> Tuple[ImplicitTS, StrMap]:
+    # MODULE[:FUNCTION], FUNCTION() (model() by default) builds the model as an ImplicitTS
+    module, _, func = spec.partition(':')
+    print(f"TS model: {spec}", file=log)
+    ts = getattr(importlib.import_module(module), func or 'model')()
+    if not isinstance(ts, ImplicitTS):
+        raise TypeError(f'{spec} returned {type(ts).__name__}, not an ImplicitTS')
+    return ts, ts.ap
+
 
 def read_BM(file: str = None) -> Tuple[List[str], List[Tuple[int, str]]]:
     if file is None:
@@ -68,3 +246,28 @@ def write_ans(s: Any, file: str = None) -> None:
     with open(file, 'a') as f:
         f.write(str(s))
         f.write('\n')
+
+
+def write_TS(ts: Union[TS[int], CompactTS], ap: StrMap, file: str) -> None:
+    # inverse of read_TS
+    trans = list(ts.iter_trans())
+    with open(file, 'w') as f:
+        f.write(f'{ts.num_states} {len(trans)}\n')
+        f.write(' '.join(map(str, ts.I)) + '\n')
+        f.write(' '.join(ts.action_set.id_to_str[i] for i in range(ts.action_set.num_str)) + '\n')
+        f.write(' '.join(ap.id_to_str[i] for i in range(ap.num_str)) + '\n')
+        for (x, a, y) in trans:
+            f.write(f'{x} {ts.action_set.id_to_str[a]} {y}\n')
+        for s in range(ts.num_states):
+            l = mask_to_tuple(ts.label(s))
+            f.write((' '.join(map(str, l)) if l else '-1') + '\n')
+
+
+def write_BM(ltl_all: List[str], ltl_state: List[Tuple[int, str]], file: str) -> None:
+    # inverse of read_BM
+    with open(file, 'w') as f:
+        f.write(f'{len(ltl_all)} {len(ltl_state)}\n')
+        for ltl in ltl_all:
+            f.write(ltl + '\n')
+        for (s, ltl) in ltl_state:
+            f.write(f'{s} {ltl}\n')
@@ -0,0 +1,171 @@
+# language-preserving reduction of NBA and GNBA, run after AST_to_GNBA and GNBA_to_NBA
+# 1. prune: keep the states reachable from Q0 that can reach an accepting cycle
+# 2. quotient: merge states that directly simulate each other
+# 3. little brothers: drop a transition (or an initial state) to a state
+#    that a sibling, read on the same label, strictly simulates
+# 4. prune again, as 3 may cut states off
+# only direct simulation is used: unlike delayed simulation, it also allows
+# step 3 and carries over to generalized acceptance
+
+from typing import Dict, Hashable, List, Set, Tuple, TypeVar, Union
+
+from structure import GNBA, NBA
+
+
+T = TypeVar('T', bound=Hashable)
+
+
+def _acc_sets(aut: Union[NBA[T], GNBA[T]]) -> List[List[T]]:
+    return [aut.F] if isinstance(aut, NBA) else aut.F
+
+
+def _rebuild(aut: Union[NBA[T], GNBA[T]], Q: List[T], Q0: List[T],
+             trans: Dict[Tuple[T, Tuple[int, ...]], List[T]]) -> Union[NBA[T], GNBA[T]]:
+    # an automaton of the same kind over Q, state_map renumbered
+    keep = set(Q)
+    if isinstance(aut, NBA):
+        res = NBA(Q=Q, Q0=Q0, F=[f for f in aut.F if f in keep])
+        res.aug_map = aut.aug_map
+    else:
+        res = GNBA(Q=Q, Q0=Q0, F=[[f for f in F if f in keep] for F in aut.F])
+    for (q, a), qq in trans.items():
+        for q_ in qq:
+            res.add_trans(q, a, q_)
+    return res
+
+
+def _accepting_sccs(aut: Union[NBA[T], GNBA[T]], succ: Dict[T, Set[T]], Q: Set[T]) -> Set[T]:
+    # the states of the SCCs (within Q) with a cycle meeting every acceptance set, by Tarjan
+    acc_sets = [set(F) for F in _acc_sets(aut)]
+    index: Dict[T, int] = {}
+    low: Dict[T, int] = {}
+    stack: List[T] = []
+    on_stack: Set[T] = set()
+    res: Set[T] = set()
+    for q0 in Q:
+        if q0 in index:
+            continue
+        index[q0] = low[q0] = len(index)
+        stack.append(q0)
+        on_stack.add(q0)
+        work = [(q0, iter(succ[q0] & Q))]
+        while work:
+            q, it = work[-1]
+            for p in it:
+                if p not in index:
+                    index[p] = low[p] = len(index)
+                    stack.append(p)
+                    on_stack.add(p)
+                    work.append((p, iter(succ[p] & Q)))
+                    break
+                if p in on_stack:
+                    low[q] = min(low[q], index[p])
+            else:
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[q])
+                if low[q] == index[q]:
+                    scc = set()
+                    while True:
+                        p = stack.pop()
+                        on_stack.discard(p)
+                        scc.add(p)
+                        if p == q:
+                            break
+                    if (len(scc) > 1 or q in succ[q]) and all(scc & F for F in acc_sets):
+                        res |= scc
+    return res
+
+
+def prune(aut: Union[NBA[T], GNBA[T]]) -> Union[NBA[T], GNBA[T]]:
+    # the states reachable from Q0 that can reach an accepting cycle
+    succ: Dict[T, Set[T]] = {q: set() for q in aut.Q}
+    pred: Dict[T, Set[T]] = {q: set() for q in aut.Q}
+    for (q, _), qq in aut.trans.items():
+        succ[q].update(qq)
+        for q_ in qq:
+            pred[q_].add(q)
+    reach = set(aut.Q0)
+    stack = list(reach)
+    while stack:
+        for p in succ[stack.pop()]:
+            if p not in reach:
+                reach.add(p)
+                stack.append(p)
+    live = _accepting_sccs(aut, succ, reach)
+    stack = list(live)
+    while stack:
+        for p in pred[stack.pop()]:
+            if p in reach and p not in live:
+                live.add(p)
+                stack.append(p)
+    Q = [q for q in aut.Q if q in live]
+    trans = {(q, a): [q_ for q_ in qq if q_ in live] for (q, a), qq in aut.trans.items() if q in live}
+    return _rebuild(aut, Q, [q for q in aut.Q0 if q in live], {k: qq for k, qq in trans.items() if qq})
+
+
+def simulation(aut: Union[NBA[T], GNBA[T]]) -> List[int]:
+    # sim[i]: the bitmask of the states directly simulating state i (by state_map id), i included
+    # r simulates q if r is in every acceptance set q is in, and each a-successor of q
+    # is simulated by some a-successor of r; the greatest such relation, by refinement
+    n = aut.num_states
+    sm = aut.state_map
+    acc = [0] * n
+    for k, F in enumerate(_acc_sets(aut)):
+        for f in F:
+            acc[sm[f]] |= 1 << k
+    letters: List[Set[Tuple[int, ...]]] = [set() for _ in range(n)]
+    edges: List[Tuple[int, Tuple[int, ...], int]] = []
+    pre: Dict[Tuple[Tuple[int, ...], int], int] = {} # (a, j) -> bitmask of the i with i -a-> j
+    for (q, a), qq in aut.trans.items():
+        i = sm[q]
+        letters[i].add(a)
+        for q_ in qq:
+            j = sm[q_]
+            edges.append((i, a, j))
+            pre[(a, j)] = pre.get((a, j), 0) | (1 << i)
+    sim = [sum(1 << r for r in range(n) if acc[i] & ~acc[r] == 0 and letters[i] <= letters[r])
+           for i in range(n)]
+    changed = True
+    while changed:
+        changed = False
+        for (i, a, j) in edges:
+            # the states with an a-successor simulating j
+            good = 0
+            m = sim[j]
+            while m:
+                low = m & -m
+                good |= pre.get((a, low.bit_length() - 1), 0)
+                m ^= low
+            if sim[i] & ~good:
+                sim[i] &= good
+                changed = True
+    return sim
+
+
+def quotient(aut: Union[NBA[T], GNBA[T]]) -> Union[NBA[T], GNBA[T]]:
+    # merge directly equivalent states, drop the transitions and initial states to little brothers
+    sim = simulation(aut)
+    Q = aut.Q
+    sm = aut.state_map
+    rep: Dict[T, T] = {}
+    for q in Q:
+        i = sm[q]
+        # the first state of the class of q, classes are closed under simulation both ways
+        j = next(j for j in range(len(Q)) if sim[i] >> j & 1 and sim[j] >> i & 1)
+        rep[q] = Q[j]
+
+    def maximal(qq: List[T]) -> List[T]:
+        # the distinct representatives of qq not strictly simulated by another one
+        R = list(dict.fromkeys(rep[q] for q in qq))
+        return [q for q in R if not any(p != q and sim[sm[q]] >> sm[p] & 1 for p in R)]
+
+    trans: Dict[Tuple[T, Tuple[int, ...]], List[T]] = {}
+    for (q, a), qq in aut.trans.items():
+        if rep[q] == q:
+            trans[(q, a)] = maximal(qq)
+    return _rebuild(aut, [q for q in Q if rep[q] == q], maximal(aut.Q0), trans)
+
+
+def reduce_automaton(aut: Union[NBA[T], GNBA[T]]) -> Union[NBA[T], GNBA[T]]:
+    return prune(quotient(prune(aut)))
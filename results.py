@@ -0,0 +1,126 @@
+# answers of a benchmark run: the plain-text answer file, optionally JSON lines,
+# and a checkpoint to resume an interrupted run from
+
+import json
+import os
+import time
+from typing import Any, Dict, IO, Optional
+
+from reader import DEFAULT_OUTPUT
+
+
+CHECKPOINT_SUFFIX = '.ckpt'
+CHECKPOINT_VERSION = 1
+FLUSH_EVERY = 100 # answers
+FLUSH_SECONDS = 5.0
+
+
+class ResultSink:
+    # answers must be written in input order, so that the i-th line of the answer file
+    # is the answer of the i-th benchmark entry of this run
+    # the files are only flushed every flush_every answers or FLUSH_SECONDS,
+    # the checkpoint records how many answers were flushed and where the files ended then
+
+    def __init__(self, output: Optional[str] = None, jsonl: Optional[str] = None,
+                 resume: bool = False, key: Optional[Dict[str, Any]] = None,
+                 flush_every: int = FLUSH_EVERY) -> None:
+        self.output = output or DEFAULT_OUTPUT
+        self.jsonl = jsonl
+        # with resume, a checkpoint next to the answer file
+        self.checkpoint = self.output + CHECKPOINT_SUFFIX if resume else None
+        self.key = key or {} # identifies the inputs, a checkpoint of other inputs is ignored
+        self.flush_every = flush_every
+        self.done = 0 # answers written, including those of the resumed run
+        self.flushed = 0
+        self.last_flush = time.monotonic()
+        self.text_file: Optional[IO[str]] = None
+        self.jsonl_file: Optional[IO[str]] = None
+
+    def open(self) -> int:
+        # return the number of entries answered by a previous run, which are skipped
+        # the answer file is appended to, as write_ans does
+        resumed = self._load_checkpoint()
+        self.text_file = open(self.output, 'a', buffering=1 << 16)
+        if self.jsonl:
+            self.jsonl_file = open(self.jsonl, 'a', buffering=1 << 16)
+        if resumed:
+            print(f'Resuming after {self.done} answered entries')
+        elif self.checkpoint:
+            self._save_checkpoint()
+        return self.done
+
+    def _load_checkpoint(self) -> bool:
+        # truncate the files to their state at the last checkpoint
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return False
+        try:
+            with open(self.checkpoint) as f:
+                ckpt = json.load(f)
+        except ValueError:
+            return False
+        if ckpt.get('version') != CHECKPOINT_VERSION or ckpt.get('key') != self.key:
+            return False
+        files = [(self.output, ckpt['text'])]
+        if self.jsonl:
+            if ckpt.get('jsonl') is None:
+                return False # no JSON lines of the answered entries
+            files.append((self.jsonl, ckpt['jsonl']))
+        for file, offset in files:
+            if not os.path.exists(file) or os.path.getsize(file) < offset:
+                return False
+        for file, offset in files:
+            with open(file, 'r+') as f:
+                f.truncate(offset)
+        self.done = self.flushed = ckpt['done']
+        return True
+
+    def _save_checkpoint(self) -> None:
+        ckpt = {
+            'version': CHECKPOINT_VERSION,
+            'key': self.key,
+            'done': self.flushed,
+            'text': self.text_file.tell(),
+            'jsonl': self.jsonl_file.tell() if self.jsonl_file is not None else None,
+        }
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(ckpt, f)
+        os.replace(tmp, self.checkpoint)
+
+    def write(self, result: int, formula: str, state: Optional[int] = None,
+              elapsed: Optional[float] = None) -> None:
+        self.text_file.write(f'{result}\n')
+        if self.jsonl_file is not None:
+            record = {'index': self.done, 'formula': formula, 'state': state, 'result': result, 'time': elapsed}
+            self.jsonl_file.write(json.dumps(record) + '\n')
+        self.done += 1
+        if self.done - self.flushed >= self.flush_every or time.monotonic() - self.last_flush >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        # the files reach the disk before the checkpoint refers to them
+        for f in (self.text_file, self.jsonl_file):
+            if f is not None:
+                f.flush()
+                if self.checkpoint:
+                    os.fsync(f.fileno())
+        self.flushed = self.done
+        self.last_flush = time.monotonic()
+        if self.checkpoint:
+            self._save_checkpoint()
+
+    def close(self, finished: bool = True) -> None:
+        # a finished run needs no checkpoint anymore
+        self.flush()
+        for f in (self.text_file, self.jsonl_file):
+            if f is not None:
+                f.close()
+        if finished and self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def __enter__(self) -> 'ResultSink':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close(finished=exc_type is None)
@@ -0,0 +1,133 @@
+# long-running checker answering queries as JSON lines,
+# over a Unix socket or stdin/stdout
+#
+# request:  {"id": any, "ts": "TS.txt", "formula": "G(a \/ b)", "state": 0}
+#           ("id" and "state" are optional, without "state" all initial states are checked)
+# response: {"id": any, "result": 1, "time": {"load": 0.0, "check": 0.01}}
+#       or: {"id": any, "error": "..."}
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, Tuple, Union
+
+from main import automata, check_ltl, make_parser
+from reader import read_TS
+from structure import CompactTS, StrMap, TS
+
+
+class Models:
+    # TS files loaded once and kept resident, reloaded if the file changes
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.models: Dict[str, Tuple[int, Union[TS[int], CompactTS], StrMap]] = {}
+        self.locks: Dict[str, Lock] = {}
+        self.lock = Lock()
+
+    def get(self, file: str) -> Tuple[Union[TS[int], CompactTS], StrMap]:
+        file = os.path.abspath(file)
+        with self.lock:
+            lock = self.locks.setdefault(file, Lock())
+        with lock: # load each file once, even if requested concurrently
+            mtime = os.stat(file).st_mtime_ns
+            if file not in self.models or self.models[file][0] != mtime:
+                # keep stdout for the responses
+                ts, ap = read_TS(file, compact=self.args.compact, cache=self.args.cache, log=sys.stderr)
+                self.models[file] = (mtime, ts, ap)
+            _, ts, ap = self.models[file]
+            return ts, ap
+
+
+def answer(models: Models, args: argparse.Namespace, request: Dict[str, Any]) -> Dict[str, Any]:
+    response: Dict[str, Any] = {'id': request.get('id', None)}
+    try:
+        t0 = time.perf_counter()
+        ts, ap = models.get(request['ts'])
+        t1 = time.perf_counter()
+        response['result'] = check_ltl(ts, ap, request['formula'], args, init=request.get('state', None))
+        t2 = time.perf_counter()
+        response['time'] = {'load': t1 - t0, 'check': t2 - t1}
+    except Exception as e: # report to the client, keep serving
+        response['error'] = f'{type(e).__name__}: {e}'
+    return response
+
+
+class Server:
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.models = Models(args)
+        self.executor = ThreadPoolExecutor(max_workers=args.workers)
+
+    async def handle(self, line: bytes, write: Callable[[Dict[str, Any]], None]) -> None:
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            write({'id': None, 'error': f'Invalid request: {e}'})
+            return
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self.executor, answer, self.models, self.args, request)
+        write(response)
+
+    async def serve(self, reader: asyncio.StreamReader, write: Callable[[Dict[str, Any]], None]) -> None:
+        # requests are answered concurrently, responses are written as they finish
+        tasks = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            task = asyncio.create_task(self.handle(line, write))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def serve_stdio(self) -> None:
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        out = sys.stdout.buffer
+
+        def write(response: Dict[str, Any]) -> None:
+            out.write(json.dumps(response).encode() + b'\n')
+            out.flush()
+
+        await self.serve(reader, write)
+
+    async def serve_socket(self, path: str) -> None:
+        async def client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            def write(response: Dict[str, Any]) -> None:
+                writer.write(json.dumps(response).encode() + b'\n')
+
+            await self.serve(reader, write)
+            await writer.drain()
+            writer.close()
+
+        if os.path.exists(path):
+            os.remove(path)
+        server = await asyncio.start_unix_server(client, path=path)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = make_parser()
+    parser.add_argument('--socket', type=str, default=None, metavar='PATH',
+                        help='listen on a Unix socket instead of stdin/stdout')
+    parser.add_argument('--workers', type=int, default=4, help='number of checking threads')
+    args = parser.parse_args()
+    automata.path = args.automaton_cache
+
+    server = Server(args)
+    if args.socket is None:
+        asyncio.run(server.serve_stdio())
+    else:
+        asyncio.run(server.serve_socket(args.socket))
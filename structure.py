@@ -1,6 +1,10 @@
 # structures to store TS and NBA
 
-from typing import Dict, Generic, Hashable, List, Set, Tuple, TypeVar, Union
+from array import array
+from collections import Counter
+from functools import lru_cache
+from itertools import accumulate
+from typing import Callable, Dict, Generic, Hashable, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, TypeVar, Union
 
 
 T = TypeVar('T', bound=Hashable)
@@ -19,6 +23,19 @@ class StrMap:
         self.num_str += 1
 
 
+@lru_cache(maxsize=None)
+def mask_to_tuple(m: int) -> Tuple[int, ...]:
+    # AP bitmask -> sorted tuple of AP ids, as in the labels of NBA.trans
+    return tuple(i for i in range(m.bit_length()) if m & (1 << i))
+
+
+def set_to_mask(l: Set[int]) -> int:
+    m = 0
+    for i in l:
+        m |= 1 << i
+    return m
+
+
 class TS(Generic[T]):
 
     def __init__(self) -> None:
@@ -28,6 +45,7 @@ class TS(Generic[T]):
         self.trans_map: Dict[Tuple[T, int], List[T]] = {} # transisions (s, a) -> all s'
         self.I: List[T] = [] # initial states
         self.AP: Dict[T, Set[int]] = {}  # atomic propositions s_i -> L(s_i)
+        self.post_map: Optional[Dict[T, List[T]]] = None # s -> all distinct s', built on demand
 
     def add_action(self, s: str) -> None:
         self.action_set.add(s)
@@ -40,6 +58,192 @@ class TS(Generic[T]):
             self.trans_map[(x, a)].append(y)
         else:
             self.trans_map[(x, a)] = [y]
+        self.post_map = None
+
+    def build_post(self) -> Dict[T, List[T]]:
+        # index the successors of each state once, actions are ignored
+        if self.post_map is None:
+            P: Dict[T, Dict[T, None]] = {}
+            for (x, _), ys in self.trans_map.items():
+                P.setdefault(x, {}).update(dict.fromkeys(ys))
+            self.post_map = {x: list(ys) for x, ys in P.items()}
+        return self.post_map
+
+    def post(self, x: T) -> List[T]:
+        # all distinct successors of x
+        return self.build_post().get(x, [])
+
+    def label(self, x: T) -> int:
+        # L(x) as a bitmask over AP ids
+        return set_to_mask(self.AP[x])
+
+    def iter_trans(self) -> Iterator[Tuple[T, int, T]]:
+        return iter(self.trans)
+
+
+def _index_code(n: int) -> str:
+    return 'i' if n < (1 << 31) else 'q'
+
+
+class CompactTS:
+    # TS with states 0, ..., num_states - 1 stored in CSR form:
+    # the transitions of s are targets[offsets[s]:offsets[s + 1]]
+    # (with actions[offsets[s]:offsets[s + 1]] if actions are kept),
+    # and L(s) is the bitmask labels[s]
+
+    def __init__(self, num_states: int, offsets: Sequence[int], targets: Sequence[int],
+                 labels: Sequence[int], actions: Optional[Sequence[int]] = None) -> None:
+        self.num_states = num_states
+        self.action_set = StrMap()
+        self.I: List[int] = [] # initial states
+        self.offsets = offsets
+        self.targets = targets
+        self.labels = labels
+        self.actions = actions
+        # distinct successors in CSR form, shared with offsets and targets
+        # unless some state has several transitions to the same target
+        self.post_offsets: Optional[Sequence[int]] = None
+        self.post_targets: Optional[Sequence[int]] = None
+
+    @classmethod
+    def from_edges(cls, num_states: int, src: Sequence[int], act: Optional[Sequence[int]],
+                   dst: Sequence[int], labels: Sequence[int]) -> 'CompactTS':
+        # stable sort of the transitions by their source, done by builtins:
+        # sorted() still builds a Python list of all T transition indices,
+        # but a counting sort would need a Python loop per transition to scatter them
+        code = _index_code(max(num_states, len(dst)))
+        count = Counter(src)
+        offsets = array(code, [0])
+        offsets.extend(accumulate(count.get(x, 0) for x in range(num_states)))
+        order = sorted(range(len(src)), key=src.__getitem__)
+        targets = array(_index_code(num_states), map(dst.__getitem__, order))
+        actions = array('i', map(act.__getitem__, order)) if act is not None else None
+        return cls(num_states, offsets, targets, labels, actions)
+
+    def relabel(self, labels: Sequence[int]) -> 'CompactTS':
+        # share the transitions, but with different labels
+        ts = CompactTS(self.num_states, self.offsets, self.targets, labels, self.actions)
+        ts.action_set = self.action_set
+        ts.I = self.I
+        ts.post_offsets = self.post_offsets
+        ts.post_targets = self.post_targets
+        return ts
+
+    def build_post(self) -> None:
+        if self.post_targets is not None:
+            return
+        offsets = self.offsets
+        targets = self.targets
+        if all(len(set(targets[offsets[x]:offsets[x + 1]])) == offsets[x + 1] - offsets[x]
+               for x in range(self.num_states)):
+            self.post_offsets = offsets
+            self.post_targets = targets
+            return
+        code = _index_code(len(targets))
+        post_offsets = array(code, [0])
+        post_targets = array(_index_code(self.num_states))
+        for x in range(self.num_states):
+            post_targets.extend(dict.fromkeys(targets[offsets[x]:offsets[x + 1]]))
+            post_offsets.append(len(post_targets))
+        self.post_offsets = post_offsets
+        self.post_targets = post_targets
+
+    def post(self, x: int) -> Sequence[int]:
+        # all distinct successors of x
+        if self.post_targets is None:
+            self.build_post()
+        return self.post_targets[self.post_offsets[x]:self.post_offsets[x + 1]]
+
+    def label(self, x: int) -> int:
+        return self.labels[x]
+
+    def iter_trans(self) -> Iterator[Tuple[int, int, int]]:
+        for x in range(self.num_states):
+            for i in range(self.offsets[x], self.offsets[x + 1]):
+                yield x, self.actions[i] if self.actions is not None else 0, self.targets[i]
+
+
+class ImplicitTS(Generic[T]):
+    # TS given by its initial states, a successor function and a labelling function,
+    # for models generated by a program: states are any hashable values (e.g. ints encoding them),
+    # and are only generated when the product explores them
+    # label(s) is a bitmask over the ids of ap
+    # either pass the functions, or override successors() and label() in a subclass
+
+    def __init__(self, I: Iterable[T], successors: Optional[Callable[[T], Iterable[T]]] = None,
+                 label: Optional[Callable[[T], int]] = None, ap: Iterable[str] = ()) -> None:
+        self.I: List[T] = list(I)
+        self.action_set = StrMap() # actions are irrelevant to LTL
+        self.ap = StrMap()
+        for p in ap:
+            self.ap.add(p)
+        self._successors = successors
+        self._label = label
+
+    def successors(self, s: T) -> Iterable[T]:
+        return self._successors(s)
+
+    def label(self, s: T) -> int:
+        return self._label(s)
+
+    def post(self, s: T) -> List[T]:
+        # all distinct successors of s
+        return list(dict.fromkeys(self.successors(s)))
+
+    def relabel(self, f: Callable[[int], int]) -> 'ImplicitTS[T]':
+        # the same TS labelled by f(label(s))
+        ts = ImplicitTS[T](self.I, self.successors, lambda s: f(self.label(s)))
+        ts.action_set = self.action_set
+        ts.ap = self.ap
+        return ts
+
+
+def _merge_cubes(masks: Set[int]) -> List[Tuple[int, int]]:
+    # disjoint cubes (pos, dont_care) covering exactly the label masks:
+    # two cubes differing in a single AP become one that does not care about it
+    cubes = {(m, 0) for m in masks}
+    merged = True
+    while merged:
+        merged = False
+        for (pos, dc) in sorted(cubes):
+            if (pos, dc) not in cubes:
+                continue
+            m = pos
+            while m:
+                bit = m & -m
+                m ^= bit
+                if (pos ^ bit, dc) in cubes:
+                    cubes.discard((pos, dc))
+                    cubes.discard((pos ^ bit, dc))
+                    cubes.add((pos ^ bit, dc | bit))
+                    merged = True
+                    break
+    return sorted(cubes)
+
+
+def compile_guards(trans: Dict[Tuple[T, Tuple[int, ...]], List[T]]) -> Dict[T, List[Tuple[int, int, List[T]]]]:
+    # the edges (q, a) -> p as guards q -> (pos, neg, targets): q reads the label mask l
+    # of a guard iff l & pos == pos and not l & neg, the APs in neither mask are don't-cares
+    # neg is negative (~ of the cared-for and true APs), so APs absent from all labels must be false
+    # the labels of the edges from q to the same p are merged into as few guards as possible
+    labels: Dict[T, Dict[T, Set[int]]] = {} # q -> p -> label masks
+    for (q, a), pp in trans.items():
+        m = set_to_mask(a)
+        for p in pp:
+            labels.setdefault(q, {}).setdefault(p, set()).add(m)
+    guards: Dict[T, List[Tuple[int, int, List[T]]]] = {}
+    for q, by_target in labels.items():
+        G: Dict[Tuple[int, int], List[T]] = {}
+        for p, masks in by_target.items():
+            for pos, dc in _merge_cubes(masks):
+                G.setdefault((pos, ~(pos | dc)), []).append(p)
+        guards[q] = [(pos, neg, pp) for (pos, neg), pp in G.items()]
+    return guards
+
+
+def make_labels(labels: List[int], num_ap: int) -> Sequence[int]:
+    # one machine word per state if possible
+    return array('Q', labels) if num_ap <= 64 else labels
 
 
 class NBA(Generic[T]):
@@ -54,7 +258,7 @@ class NBA(Generic[T]):
         for i, q in enumerate(self.Q):
             self.state_map[q] = i
         self.aug_map: Dict[T, int] = None
-        self.in_count: Dict[T, int] = {q : 0 for q in self.Q}
+        self.guards: Optional[Dict[T, List[Tuple[int, int, List[T]]]]] = None # compiled from trans by match
 
     def add_trans(self, q: T, a: Tuple[int, ...], qq: T) -> None:
         aa = list(a)
@@ -64,27 +268,20 @@ class NBA(Generic[T]):
             self.trans[(q, a)].append(qq)
         else:
             self.trans[(q, a)] = [qq]
-        self.in_count[qq] += 1
+        self.guards = None
     
     def get(self, q: T, a: Tuple[int, ...]) -> List[T]:
         return self.trans.get((q, a), [])
 
+    def match(self, q: T, l: int) -> List[T]:
+        # the successors of q reading the label mask l, by the guards of q
+        if self.guards is None:
+            self.guards = compile_guards(self.trans)
+        return [p for pos, neg, pp in self.guards.get(q, ()) if l & pos == pos and not l & neg for p in pp]
+
     def get_id(self, s: int, q: T) -> int:
         return s * self.num_states + self.state_map[q]
 
-    def simplify(self) -> None:
-        # remove states that cannot be reached
-        self.Q = [q for q in self.Q if self.in_count[q] > 0]
-        self.Q0 = [q0 for q0 in self.Q0 if self.in_count[q0] > 0]
-        self.F = [f for f in self.F if self.in_count[f] > 0]
-        self.num_states = len(self.Q)
-        rm_keys = []
-        for (q, a) in self.trans.keys():
-            if self.in_count[q] == 0:
-                rm_keys.append((q, a))
-        for k in rm_keys:
-            del self.trans[k]
-
     def print(self) -> None:
         if self.aug_map is not None:
             print('---- NBA ----')
@@ -109,6 +306,7 @@ class GNBA(Generic[T]):
         self.state_map: Dict[T, int] = {}
         for i, q in enumerate(self.Q):
             self.state_map[q] = i
+        self.guards: Optional[Dict[T, List[Tuple[int, int, List[T]]]]] = None # compiled from trans by match
 
     def add_trans(self, q: T, a: Tuple[int, ...], qq: T) -> None:
         aa = list(a)
@@ -118,10 +316,17 @@ class GNBA(Generic[T]):
             self.trans[(q, a)].append(qq)
         else:
             self.trans[(q, a)] = [qq]
+        self.guards = None
 
     def get(self, q: T, a: Tuple[int, ...]) -> List[T]:
         return self.trans.get((q, a), [])
 
+    def match(self, q: T, l: int) -> List[T]:
+        # the successors of q reading the label mask l, by the guards of q
+        if self.guards is None:
+            self.guards = compile_guards(self.trans)
+        return [p for pos, neg, pp in self.guards.get(q, ()) if l & pos == pos and not l & neg for p in pp]
+
     def print(self) -> None:
         print('---- GNBA ----')
         print(f'num states = {self.num_states}')
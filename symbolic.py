@@ -0,0 +1,171 @@
+# symbolic emptiness check of the product NBA * TS with BDDs
+# a product state (s, q) is encoded in binary, s by the TS variables and q by the automaton variables,
+# each variable is followed by its primed copy, which encodes the successor state
+
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from bdd import BDD, Function
+from structure import CompactTS, GNBA, NBA, StrMap, TS
+
+
+def _spread(x: int) -> int:
+    # move bit i of x to bit 2i
+    r = 0
+    i = 0
+    while x:
+        r |= _SPREAD[x & 0xff] << (16 * i)
+        x >>= 8
+        i += 1
+    return r
+
+
+_SPREAD = [sum(((b >> i) & 1) << (2 * i) for i in range(8)) for b in range(256)]
+
+
+def interleave(x: int, y: int) -> int:
+    # the key of (x, y) for BDD.from_keys over the variables x0 < y0 < x1 < y1 < ...
+    return (_spread(x) << 1) | _spread(y)
+
+
+def num_bits(n: int) -> int:
+    return max(1, (n - 1).bit_length())
+
+
+class SymbolicTS:
+    # the transition relation and the labels of a TS as BDDs, shared by all formulae
+    # variables 2i and 2i + 1 are bit i of s and s' (the highest bit first),
+    # the automaton variables follow
+
+    def __init__(self, ts: Union[TS[int], CompactTS], ap: StrMap) -> None:
+        self.ts = ts
+        self.ap = ap
+        self.bdd = BDD()
+        self.bits = num_bits(ts.num_states)
+        self.bdd.add_vars(2 * self.bits)
+        self.s_vars = list(range(0, 2 * self.bits, 2))
+        self.t_vars = list(range(1, 2 * self.bits, 2))
+        self.to_next = dict(zip(self.s_vars, self.t_vars))
+        spread = [_spread(s) for s in range(ts.num_states)]
+        keys = sorted({(spread[s] << 1) | spread[t] for (s, _, t) in ts.iter_trans()})
+        del spread
+        self.trans = self.bdd.from_keys(sorted(self.s_vars + self.t_vars), keys)
+        self.labels: Dict[Tuple[str, bool], Function] = {}
+        self.lock = Lock() # the BDD manager is not thread-safe
+
+    def states(self, S: Sequence[int]) -> Function:
+        return self.bdd.from_keys(self.s_vars, sorted(set(S)))
+
+    def label(self, name: str, primed: bool = False) -> Function:
+        # the states (or successors) where an AP holds, no state for an AP not in the TS
+        key = (name, primed)
+        if key not in self.labels:
+            i = self.ap.str_to_id.get(name, None)
+            if i is None:
+                f = self.bdd.false
+            else:
+                f = self.states([s for s in range(self.ts.num_states) if self.ts.label(s) >> i & 1])
+            self.labels[key] = self.bdd.rename(f, self.to_next) if primed else f
+        return self.labels[key]
+
+
+class SymbolicProduct:
+    # the product of a SymbolicTS and an automaton, whose states are encoded by their state_map ids
+
+    def __init__(self, sts: SymbolicTS, aut: Union[NBA, GNBA], aut_ap: StrMap,
+                 init: Optional[List[int]] = None) -> None:
+        self.bdd = bdd = sts.bdd
+        m = num_bits(aut.num_states)
+        base = 2 * sts.bits
+        bdd.ensure_vars(base + 2 * m)
+        q_vars = list(range(base, base + 2 * m, 2))
+        p_vars = list(range(base + 1, base + 2 * m, 2))
+        self.cur = sts.s_vars + q_vars
+        self.nxt = sts.t_vars + p_vars
+        self.to_next = dict(zip(self.cur, self.nxt))
+        self.to_cur = dict(zip(self.nxt, self.cur))
+
+        # the label A of the automaton, as states (or successors) of the TS labelled by exactly A
+        # (an AP occurring twice in the formula gets two ids, labels only use those of str_to_id)
+        exact: Dict[Tuple[Tuple[int, ...], bool], Function] = {}
+
+        def labelled(A: Tuple[int, ...], primed: bool) -> Function:
+            if (A, primed) not in exact:
+                f = bdd.true
+                for name, i in aut_ap.str_to_id.items():
+                    l = sts.label(name, primed)
+                    f = f & (l if i in A else ~l)
+                exact[(A, primed)] = f
+            return exact[(A, primed)]
+
+        # (q, L(t), p) of the automaton, grouped by the label
+        sm = aut.state_map
+        edges: Dict[Tuple[int, ...], List[int]] = {}
+        starts: Dict[Tuple[int, ...], List[int]] = {}
+        Q0 = set(aut.Q0)
+        for (q, A), pp in aut.trans.items():
+            edges.setdefault(A, []).extend(interleave(sm[q], sm[p]) for p in pp)
+            if q in Q0:
+                starts.setdefault(A, []).extend(sm[p] for p in pp)
+        qp_vars = sorted(q_vars + p_vars)
+        step = bdd.false
+        for A, keys in edges.items():
+            step = step | (labelled(A, True) & bdd.from_keys(qp_vars, sorted(set(keys))))
+        self.trans = sts.trans & step
+        # (s0, p) for p in delta(q0, L(s0)), as in NBA_product_TS
+        S0 = sts.states(init if init is not None else sts.ts.I)
+        self.init = bdd.false
+        for A, ps in starts.items():
+            self.init = self.init | (S0 & labelled(A, False) & bdd.from_keys(q_vars, sorted(set(ps))))
+        Fs = [aut.F] if isinstance(aut, NBA) else aut.F
+        self.accepting = [bdd.from_keys(q_vars, sorted({sm[q] for q in F})) for F in Fs] or [bdd.true]
+
+    def image(self, X: Function) -> Function:
+        # the successors of X
+        return self.bdd.rename(self.bdd.and_exist(X, self.trans, self.cur), self.to_cur)
+
+    def preimage(self, X: Function) -> Function:
+        # the predecessors of X
+        return self.bdd.and_exist(self.trans, self.bdd.rename(X, self.to_next), self.nxt)
+
+    def reachable(self) -> Function:
+        reach = frontier = self.init
+        while not frontier.is_false:
+            frontier = self.image(frontier) - reach
+            reach = reach | frontier
+        return reach
+
+    def fair_states(self, Z: Function, stats: Optional[Dict[str, int]] = None) -> Function:
+        # Emerson-Lei: the greatest Z such that from each state of Z,
+        # every acceptance set can be reached within Z in one or more steps
+        # nu Z. /\_i EX E[Z U (Z /\ F_i)]
+        while True:
+            Z_ = Z
+            for F in self.accepting:
+                Y = target = Z & F
+                while True: # E[Z U target], backwards
+                    Y_ = Y | (Z & self.preimage(Y))
+                    if Y_ == Y:
+                        break
+                    Y = Y_
+                Z = Z & self.preimage(Y)
+                if stats is not None:
+                    stats['fixpoint_iterations'] = stats.get('fixpoint_iterations', 0) + 1
+            if Z == Z_:
+                return Z
+
+
+def check_symbolic(aut: Union[NBA, GNBA], sts: SymbolicTS, aut_ap: StrMap, init: Optional[List[int]] = None,
+                   stats: Optional[Dict[str, int]] = None) -> bool:
+    # True iff the product has no accepting run, like the explicit checks
+    # the fair states among the reachable ones are exactly those with an accepting run
+    with sts.lock:
+        prod = SymbolicProduct(sts, aut, aut_ap, init)
+        reach = prod.reachable()
+        fair = prod.fair_states(reach, stats)
+        if stats is not None:
+            bdd = sts.bdd
+            stats['reachable'] = stats.get('reachable', 0) + bdd.count(reach, prod.cur)
+            stats['transition_nodes'] = stats.get('transition_nodes', 0) + bdd.size(prod.trans)
+            stats['bdd_nodes'] = len(bdd.unique) + 2
+        return fair.is_false
@@ -0,0 +1,130 @@
+# on-the-fly tableau construction (Gerth, Peled, Vardi, Wolper, 1995)
+# AST -> GNBA, only building the states reachable from the initial obligations
+
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from ltl_node import *
+from ltl_parser import AST
+from structure import GNBA
+
+
+# a state is determined by the formulae holding now and those required next
+State = Tuple[FrozenSet[Node], FrozenSet[Node]]
+
+
+class TableauNode:
+
+    def __init__(self, incoming: Set[Optional[State]], new: Set[Node],
+                 old: Set[Node], nxt: Set[Node]) -> None:
+        self.incoming = incoming # None stands for the initial pseudo state
+        self.new = new # obligations to be processed
+        self.old = old # obligations already processed
+        self.next = nxt # obligations for the successors
+
+    def split(self) -> 'TableauNode':
+        return TableauNode(set(self.incoming), set(self.new), set(self.old), set(self.next))
+
+
+def _is_literal(n: Node) -> bool:
+    if isinstance(n, (LiteralNode, APNode)):
+        return True
+    return isinstance(n, UnaryNode) and n.op == UNARY_OP.NOT and isinstance(n.oprand, APNode)
+
+
+def expand(root: Node) -> Dict[State, Set[Optional[State]]]:
+    # return all reachable states and their predecessors
+    states: Dict[State, Set[Optional[State]]] = {}
+    stack = [TableauNode({None}, {root}, set(), set())]
+    while stack:
+        node = stack.pop()
+        if not node.new:
+            key = (frozenset(node.old), frozenset(node.next))
+            if key in states:
+                states[key].update(node.incoming)
+            else:
+                states[key] = node.incoming
+                stack.append(TableauNode({key}, set(node.next), set(), set()))
+            continue
+        n = node.new.pop()
+        if n in node.old:
+            stack.append(node)
+            continue
+        if _is_literal(n):
+            if n == FALSE_NODE or get_neg(n) in node.old:
+                continue # contradiction, discard the node
+            node.old.add(n)
+            stack.append(node)
+        elif isinstance(n, UnaryNode) and n.op == UNARY_OP.NXT:
+            node.old.add(n)
+            node.next.add(n.oprand)
+            stack.append(node)
+        elif isinstance(n, BinaryNode) and n.op == BINARY_OP.AND:
+            node.old.add(n)
+            node.new.update({n.oprand1, n.oprand2} - node.old)
+            stack.append(node)
+        elif isinstance(n, BinaryNode):
+            node.old.add(n)
+            node1 = node.split()
+            if n.op == BINARY_OP.UTL: # a U b === b \/ (a /\ X(a U b))
+                node1.new.add(n.oprand1)
+                node1.next.add(n)
+                node.new.add(n.oprand2)
+            elif n.op == BINARY_OP.RLS: # a R b === (a /\ b) \/ (b /\ X(a R b))
+                node1.new.add(n.oprand2)
+                node1.next.add(n)
+                node.new.update({n.oprand1, n.oprand2})
+            elif n.op == BINARY_OP.OR:
+                node1.new.add(n.oprand1)
+                node.new.add(n.oprand2)
+            else:
+                raise ValueError(f'Unexpected binary op: {n.op_str}')
+            node1.new -= node1.old
+            node.new -= node.old
+            stack.append(node1)
+            stack.append(node)
+        else:
+            raise ValueError(f'Unexpected node: {n}')
+    return states
+
+
+def AST_to_GNBA_tableau(ast: AST) -> GNBA[State]:
+    root = get_nnf(ast.root)
+    states = expand(root)
+    Q = list(states.keys())
+    Q0 = [q for q in Q if None in states[q]]
+    F: List[List[State]] = []
+    for n in set(root._sub()):
+        if isinstance(n, BinaryNode) and n.op == BINARY_OP.UTL:
+            F.append([q for q in Q if n not in q[0] or n.oprand2 in q[0]])
+    gnba = GNBA[State](Q=Q, Q0=Q0, F=F)
+    succ: Dict[State, List[State]] = {q: [] for q in Q}
+    for qq, incoming in states.items():
+        for q in incoming:
+            if q is not None:
+                succ[q].append(qq)
+    # AST.AP gives every occurrence of an AP its own id, only the ids in str_to_id can be set
+    ap_ids = sorted(set(ast.AP.str_to_id.values()))
+    all_aps = sum(1 << i for i in ap_ids)
+    for q in Q:
+        # the literals of q only constrain part of the APs,
+        # the label can be any valuation consistent with them
+        pos = 0
+        neg = 0
+        for n in q[0]:
+            if isinstance(n, APNode):
+                pos |= 1 << ast.AP.str_to_id[n.ap]
+            elif _is_literal(n) and isinstance(n, UnaryNode):
+                neg |= 1 << ast.AP.str_to_id[n.oprand.ap]
+        free = all_aps & ~(pos | neg)
+        labels: List[Tuple[int, ...]] = []
+        sub = free
+        while True:
+            A = pos | sub
+            labels.append(tuple(i for i in ap_ids if A & (1 << i)))
+            if sub == 0:
+                break
+            sub = (sub - 1) & free
+        for A in labels:
+            for qq in succ[q]:
+                gnba.add_trans(q, A, qq)
+    return gnba
@@ -3,9 +3,11 @@ from antlr.ltlLexer import ltlLexer
 from antlr.ltlParser import ltlParser
 from antlr.ltlVisitor import ltlVisitor
 
+from dfs import nested_dfs
 from ltl_node import *
 from ltl_parser import *
 from structure import *
+from tableau import *
 from transform import *
 
 
@@ -65,6 +67,24 @@ def check_gnba():
     gnba.print()
 
 
+def check_tableau():
+    s = '!(G(a->((!b) U (a /\\ b))))'
+    ast = AST(s)
+    print(ast)
+    print('NNF:', get_nnf(ast.root))
+
+    gnba = AST_to_GNBA_tableau(ast)
+    gnba.print()
+
+    # repeated occurrences of an AP do not multiply the labels
+    edges = []
+    for k in [1, 2, 6, 13]:
+        gnba = AST_to_GNBA_tableau(AST('!(' + ' \\/ '.join(['a'] * k + ['G F b']) + ')'))
+        edges.append(sum(len(qq) for qq in gnba.trans.values()))
+    print('edges:', edges)
+    assert len(set(edges)) == 1
+
+
 def check_nba():
     # s = '!(G(a->((!b) U (a /\\ b))))'
     # ast = AST(s)
@@ -116,9 +136,161 @@ def check_prod():
     print(prod.trans)
 
 
+def check_syntax():
+    # malformed formulae raise LTLSyntaxError, with either parser
+    for ltl in ['a U', '(a', 'a /\\ /\\ b', 'G', ')a(', 'a $ b', 'ab', 'a b)']:
+        for use_antlr in [False, True]:
+            try:
+                parse(ltl, use_antlr)
+            except LTLSyntaxError as e:
+                print(ltl, use_antlr, e)
+            else:
+                assert False, ltl
+
+
+def check_symbolic():
+    # the BDD engine agrees with the explicit ones
+    # GNBA_to_NBA builds only the reachable level copies (q, j), by a breadth-first search,
+    # and numbers them densely, as the BDD encoding needs
+    from main import check_ltl, make_parser
+    n = 8
+    ap = StrMap()
+    ap.add('a')
+    ap.add('b')
+    ts = TS[int]()
+    ts.num_states = n
+    ts.I.append(0)
+    ts.add_action('0')
+    for s in range(n):
+        ts.AP[s] = {i for i in range(2) if s % (i + 2) == 0}
+        for t in ((s + 1) % n, (3 * s) % n):
+            ts.add_trans(s, 0, t)
+
+    for ltl in ['F(X(F(a)))', 'G F b', 'G (b -> X !a)', 'F G a', 'a U b']:
+        ast = AST(f'!({ltl})')
+        gnba = AST_to_GNBA(ast)
+        nba = GNBA_to_NBA(gnba)
+        assert sorted(nba.state_map.values()) == list(range(nba.num_states))
+        if ltl == 'F(X(F(a)))':
+            assert nba.num_states < len(gnba.Q) * len(gnba.F) # fewer than the textbook copies
+        results = [check_ltl(ts, ap, ltl, make_parser().parse_args(['--engine', e]))
+                   for e in ['ndfs', 'textbook', 'scc', 'bdd']]
+        print(ltl, results)
+        assert len(set(results)) == 1
+
+
+def check_implicit():
+    # the same model explored on the fly and materialized
+    n = 8
+    succ = lambda s: ((s + 1) % n, (2 * s) % n)
+    label = lambda s: int(s % 2 == 0) | (int(s == 0) << 1)
+    its = ImplicitTS([0], succ, label, ['a', 'b'])
+    ts = TS[int]()
+    ts.num_states = n
+    ts.I.append(0)
+    ts.add_action('0')
+    for s in range(n):
+        ts.AP[s] = set(mask_to_tuple(label(s)))
+        for t in succ(s):
+            ts.add_trans(s, 0, t)
+
+    for ltl in ['G F b', 'G (b -> X !a)', 'F G a', 'a U b']:
+        ast = AST(f'!({ltl})')
+        nba = GNBA_to_NBA(AST_to_GNBA(ast))
+        lazy = LazyProduct(nba, partial_ts(its, ast, its.ap))
+        prod = NBA_product_TS(nba, partial_ts(ts, ast, its.ap))
+        results = [nested_dfs(lazy, nba), nested_dfs(prod, nba)]
+        print(ltl, results)
+        assert results[0] == results[1]
+
+
+def check_por():
+    # ample-set reduction keeps the verdicts of the full product on interleaved processes,
+    # and does reduce it: the steps of process 2 commute with the others and are invisible
+    from main import check_ltl, make_parser
+    from profiler import Profile
+    k, m = 3, 3 # processes, local states of each
+    ap = StrMap()
+    ap.add('a') # process 0 in its local state 0
+    ap.add('b') # process 1 in its local state 2
+    ts = TS[int]()
+    ts.num_states = m ** k
+    ts.I.append(0)
+    for i in range(k):
+        ts.add_action(f'p{i}')
+    for s in range(ts.num_states):
+        local = [s // m ** i % m for i in range(k)]
+        ts.AP[s] = {i for i, (j, l) in enumerate([(0, 0), (1, 2)]) if local[j] == l}
+        for i in range(k):
+            ts.add_trans(s, i, s + ((local[i] + 1) % m - local[i]) * m ** i)
+
+    reduced = 0
+    for ltl in ['G F a', 'F G a', 'G (a -> F b)', 'a U b', 'G !(a /\\ b)', 'F (a /\\ b)',
+                '!b U a', 'G F a \\/ F G !a']:
+        full = check_ltl(ts, ap, ltl, make_parser().parse_args([]))
+        prof = Profile()
+        por = check_ltl(ts, ap, ltl, make_parser().parse_args(['--por']), prof=prof)
+        print(ltl, full, por, prof.counters.get('por_reduced', 0))
+        assert full == por
+        reduced += prof.counters.get('por_reduced', 0)
+    assert reduced > 0
+
+
+def check_reduce():
+    # --reduce keeps the language: the verdicts agree with the unreduced automata,
+    # on the GNBA (scc engine) and on the NBA (ndfs) path, and the automata do shrink
+    import random
+    from generator import random_ltl, random_ts
+    from main import check_ltl, make_parser, translate
+    rng = random.Random(7)
+    shrunk = 0
+    for _ in range(10):
+        ts, ap = random_ts(12, num_ap=2, num_init=3, rng=rng)
+        for _ in range(5):
+            ltl = random_ltl(3, num_ap=2, rng=rng)
+            for flags in [[], ['--tableau'], ['--engine', 'scc'], ['--engine', 'scc', '--tableau']]:
+                args = make_parser().parse_args(flags)
+                reduced = make_parser().parse_args(flags + ['--reduce'])
+                assert check_ltl(ts, ap, ltl, args) == check_ltl(ts, ap, ltl, reduced), (ltl, flags)
+                generalized = args.engine == 'scc'
+                shrunk += (translate(ltl, args, generalized)[1].num_states >
+                           translate(ltl, reduced, generalized)[1].num_states)
+    print('shrunk:', shrunk)
+    assert shrunk > 0
+
+
+def check_simplify():
+    # every rewrite rule (the examples of the readme) keeps the formula equivalent:
+    # f /\\ !simplify(f) and simplify(f) /\\ !f have empty automata
+    # there are no literals in the grammar, c \\/ !c stands for true and c /\\ !c for false
+    from reduction import prune
+    t, f = '(c \\/ !c)', '(c /\\ !c)'
+    examples = [
+        f'a /\\ {t}', f'a /\\ {f}', 'a /\\ !a', f'X {t}', f'a U {t}', f'{f} U b',
+        'a /\\ a', 'a U a', 'a /\\ (a \\/ b)', 'a /\\ !(a /\\ b)',
+        'X a /\\ X b', 'X a U X b',
+        'a U (a U b)', '(a U b) U b', 'a U F b', 'F(a U b)', 'F(a \\/ F b)', 'F G F a', 'G F G a', 'G(G(a))',
+    ]
+    for ltl in examples:
+        n = AST(ltl).root
+        m = simplify(n)
+        print(ltl, '->', m)
+        assert m != n
+        for x, y in ((n, m), (m, n)):
+            ast = AST(root=BinaryNode(op=BINARY_OP.AND, opr1=x, opr2=get_neg(y)))
+            assert prune(AST_to_GNBA(ast)).num_states == 0, (str(x), str(y))
+
+
 if __name__ == '__main__':
     # check_grammar()
     # check_ast()
     # check_gnba()
+    # check_tableau()
     # check_nba()
+    # check_syntax()
+    # check_symbolic()
+    # check_implicit()
+    # check_por()
+    # check_reduce()
+    # check_simplify()
     check_prod()
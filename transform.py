@@ -1,9 +1,7 @@
 # transform functions including
 # AST -> GNBA
 # GNBA -> NBA
-# NBA * TS
-
-from typing import FrozenSet
+# NBA * TS (materialized or lazy)
 
 from structure import *
 from ltl_parser import *
@@ -13,81 +11,192 @@ T = TypeVar('T', bound=Hashable)
 U = TypeVar('U', bound=Hashable)
 
 
-def AST_to_GNBA(ast: AST) -> GNBA[Set[Node]]:
-    Q = ast.get_elementary_sets()
-    Q0 = [b for b in Q if ast.root in b]
+def AST_to_GNBA(ast: AST) -> GNBA[int]:
+    # states are elementary sets encoded as bitmasks, see AST._index_closure
+    Q = ast.get_elementary_masks()
+    root = 1 << ast.index[ast.root]
+    Q0 = [b for b in Q if b & root]
     F = []
-    APSet = frozenset([APNode(a) for a in ast.AP.str_to_id.keys()])
-    for n in ast.closure:
-        if isinstance(n, BinaryNode) and n.op == BINARY_OP.UTL:
-            p2 = n.oprand2
-            f = [b for b in Q if not (n in b and p2 not in b)]
-            F.append(f)
-    gnba = GNBA[FrozenSet[Node]](Q=Q, Q0=Q0, F=F)
+    for n, _, p2 in ast.until_rules:
+        f = [b for b in Q if not (b & n and not b & p2)]
+        F.append(f)
+    gnba = GNBA[int](Q=Q, Q0=Q0, F=F)
+    # successor conditions only look at the operands of X and at the Untils,
+    # so states are bucketed by these bits
+    key_bits = 0
+    for _, p in ast.next_rules:
+        key_bits |= p
+    for n, _, _ in ast.until_rules:
+        key_bits |= n
+    buckets: Dict[int, List[int]] = {}
+    for bb in gnba.Q:
+        buckets.setdefault(bb & key_bits, []).append(bb)
     for b in gnba.Q: 
         # calculate transition function
-        A: FrozenSet[APNode] = b & APSet # note that A can be empty set
-        A = tuple(ast.AP.str_to_id[n.ap] for n in A)
-        for bb in gnba.Q:
-            if ast.check_next(b, bb) and ast.check_until(b, bb):
-                gnba.add_trans(b, A, bb)
+        A = ast.get_label(b) # note that A can be empty set
+        succ = ast.get_successor_mask(b)
+        if succ is None:
+            continue
+        care, req = succ
+        # the successors are the buckets req | sub, for all sub of the Untils b does not care about
+        free = key_bits & ~care
+        if 1 << bin(free).count('1') <= len(buckets):
+            sub = free
+            while True:
+                for bb in buckets.get(req | sub, ()):
+                    gnba.add_trans(b, A, bb)
+                if not sub:
+                    break
+                sub = (sub - 1) & free
+        else: # fewer buckets than keys
+            for key, bbs in buckets.items():
+                if key & care == req:
+                    for bb in bbs:
+                        gnba.add_trans(b, A, bb)
     return gnba
 
 
+def acceptance_sets(gnba: GNBA[T]) -> List[FrozenSet[T]]:
+    # the acceptance sets that matter, smallest first: trivial sets (holding every state) are dropped,
+    # and so are duplicates and supersets of other sets, which are visited whenever the subset is
+    Q = set(gnba.Q)
+    sets = sorted(dict.fromkeys(frozenset(F) for F in gnba.F if not Q <= set(F)), key=len)
+    res: List[FrozenSet[T]] = []
+    for S in sets:
+        if not any(R <= S for R in res):
+            res.append(S)
+    return res
+
+
 def GNBA_to_NBA(gnba: GNBA[T]) -> NBA[Tuple[T, int]]:
-    fnum = len(gnba.F)
-    if fnum == 0: 
-        # accept all infinite fun
-        Q = [(q, 0) for q in gnba.Q]
-        Q0 = [(q0, 0) for q0 in gnba.Q0]
-        nba = NBA[Tuple[T, int]](Q=Q, Q0=Q0, F=Q)
-        nba.aug_map = gnba.state_map
-        for (q, a), qq in gnba.trans.items():
+    # states (q, j): q waits for the j-th acceptance set
+    # the level jumps over all consecutive sets q is in (not only the j-th), and (q, j) is accepting
+    # if the jump passes the last set, the level then starts over at 0
+    # without acceptance sets every state is accepting
+    # only the states reachable from the initial states are created
+    sets = acceptance_sets(gnba)
+    fnum = len(sets)
+    acc: Dict[T, int] = {} # q -> bitmask of the sets q is in
+    for k, S in enumerate(sets):
+        for q in S:
+            acc[q] = acc.get(q, 0) | (1 << k)
+    out: Dict[T, List[Tuple[Tuple[int, ...], List[T]]]] = {}
+    for (q, a), qq in gnba.trans.items():
+        out.setdefault(q, []).append((a, qq))
+    Q0 = list(dict.fromkeys((q0, 0) for q0 in gnba.Q0))
+    Q = list(Q0)
+    seen = set(Q)
+    F: List[Tuple[T, int]] = []
+    edges: List[Tuple[Tuple[T, int], Tuple[int, ...], Tuple[T, int]]] = []
+    i = 0
+    while i < len(Q):
+        q, j = Q[i]
+        i += 1
+        m = acc.get(q, 0) >> j
+        j_ = j + (m ^ (m + 1)).bit_length() - 1 # past the trailing sets q is in
+        if j_ == fnum:
+            F.append((q, j))
+            j_ = 0
+        for a, qq in out.get(q, ()):
             for q_ in qq:
-                nba.add_trans((q, 0), a, (q_, 0))
-    else:
-        Q = [(q, i) for q in gnba.Q for i in range(fnum)]
-        Q0 = [(q0, 0) for q0 in gnba.Q0]
-        F = [(f, 0) for f in gnba.F[0]]
-        nba = NBA[Tuple[T, int]](Q=Q, Q0=Q0, F=F)
-        nba.aug_map = gnba.state_map
-        for (q, a), qq in gnba.trans.items():
-            for j in range(fnum):
-                for q_ in qq:
-                    if q in gnba.F[j]:
-                        nba.add_trans((q, j), a, (q_, (j + 1) % fnum))
-                    else:
-                        nba.add_trans((q, j), a, (q_, j))
-    nba.simplify()
+                x = (q_, j_)
+                edges.append(((q, j), a, x))
+                if x not in seen:
+                    seen.add(x)
+                    Q.append(x)
+    nba = NBA[Tuple[T, int]](Q=Q, Q0=Q0, F=F)
+    nba.aug_map = gnba.state_map
+    for x, a, y in edges:
+        nba.add_trans(x, a, y)
     return nba
 
 
-def NBA_product_TS(nba: NBA[T], ts: TS[U]) -> TS[Tuple[U, int]]:
+def NBA_product_TS(nba: Union[NBA[T], GNBA[T]], ts: Union[TS[U], CompactTS]) -> TS[Tuple[U, int]]:
     prod = TS[Tuple[U, int]]()
-    for (s, a, t) in ts.trans:
-        for q in nba.Q:
-            pp = nba.get(q, tuple(ts.AP[t]))
-            for p in pp:
-                prod.add_trans((s, nba.state_map[q]), a, (t, nba.state_map[p]))
+    sm = nba.state_map
+    edges: Dict[int, List[Tuple[int, int]]] = {} # label mask -> the edges (q, p) reading it, by id
+    for (s, a, t) in ts.iter_trans():
+        l = ts.label(t)
+        E = edges.get(l, None)
+        if E is None: # few distinct labels, each matched against the guards once
+            E = edges[l] = [(sm[q], sm[p]) for q in nba.Q for p in nba.match(q, l)]
+        for i, j in E:
+            prod.add_trans((s, i), a, (t, j))
     for s in ts.I:
         ql: List[T] = []
         for q0 in nba.Q0:
-            qq = nba.get(q0, tuple(ts.AP[s]))
-            ql.extend(qq)
+            ql.extend(nba.match(q0, ts.label(s)))
         for q in ql:
             prod.I.append((s, nba.state_map[q]))
     prod.action_set = ts.action_set
+    if prod.action_set.num_str == 0:
+        # transitions without actions are all labelled by action 0
+        prod.action_set = StrMap()
+        prod.add_action('')
     return prod
 
 
-def partial_ts(ts: TS[T], ast: AST, ap: StrMap) -> TS[T]:
+class LazyProduct(Generic[U]):
+    # NBA * TS (or GNBA * TS) without materialization
+    # successors of (s, q) are generated from ts.post and nba.match on demand,
+    # so that only the states visited by the search are ever built
+    # this is the only product of an ImplicitTS, whose states are not known up front
+
+    def __init__(self, nba: Union[NBA[T], GNBA[T]], ts: Union[TS[U], CompactTS, ImplicitTS[U]]) -> None:
+        self.nba = nba
+        self.ts = ts
+        self.action_set = ts.action_set
+        self.id_map: Dict[int, T] = {i: q for q, i in nba.state_map.items()}
+        self.I: List[Tuple[U, int]] = []
+        for s in ts.I:
+            for q0 in nba.Q0:
+                for q in nba.match(q0, ts.label(s)):
+                    self.I.append((s, nba.state_map[q]))
+
+    def post(self, x: Tuple[U, int]) -> List[Tuple[U, int]]:
+        s, i = x
+        q = self.id_map[i]
+        P: Dict[Tuple[U, int], None] = {}
+        for t in self.ts.post(s):
+            for p in self.nba.match(q, self.ts.label(t)):
+                P[(t, self.nba.state_map[p])] = None
+        return list(P)
+
+
+def label_map(ast: AST, ap: StrMap) -> Callable[[int], int]:
+    # label over the AP ids of ts -> label over the AP ids of ast, irrelevant AP removed
+    ids = [(i, ast.AP.str_to_id.get(ap.id_to_str[i], None)) for i in range(ap.num_str)]
+    ids = [(1 << i, 1 << j) for i, j in ids if j is not None]
+    relabel: Dict[int, int] = {} # few distinct labels
+
+    def f(l: int) -> int:
+        l_ = relabel.get(l, None)
+        if l_ is None:
+            l_ = 0
+            for i, j in ids:
+                if l & i:
+                    l_ |= j
+            relabel[l] = l_
+        return l_
+
+    return f
+
+
+def partial_ts(ts: Union[TS[T], CompactTS, ImplicitTS[T]], ast: AST,
+               ap: StrMap) -> Union[TS[T], CompactTS, ImplicitTS[T]]:
     # remove irrelevant AP from ts
+    if isinstance(ts, ImplicitTS):
+        return ts.relabel(label_map(ast, ap))
+    if isinstance(ts, CompactTS):
+        f = label_map(ast, ap)
+        return ts.relabel(make_labels([f(l) for l in ts.labels], ast.AP.num_str))
     ts_ = TS[T]()
     ts_.num_states = ts.num_states
     ts_.action_set = ts.action_set
     ts_.I = ts.I
     ts_.trans = ts.trans
     ts_.trans_map = ts.trans_map
+    ts_.post_map = ts.build_post() # shared by all formulae
     for s, l in ts.AP.items():
         l_: Set[int] = set()
         for ll in l: